@@ -0,0 +1,36 @@
+"""
+Process-spawn overhead of small git calls: Git.call_git_cmd() running a string
+in shell (the old way, an extra /bin/sh per call) vs. executing argv directly.
+
+Calls `git rev-parse HEAD` in a temporary repository.
+
+Usage: PYTHONPATH=. python3 benchmarks/bench_git.py [number]
+"""
+
+import subprocess
+import sys
+from tempfile import TemporaryDirectory
+from timeit import timeit
+
+from frambo.git import Git
+
+
+def main(number):
+    with TemporaryDirectory(prefix="bench git ") as repo:
+        subprocess.check_call(["git", "init", "--quiet", repo])
+        subprocess.check_call(
+            ["git", "-C", repo, "-c", "user.name=b", "-c", "user.email=b@e.nch"]
+            + ["commit", "--quiet", "--allow-empty", "-m", "bench"]
+        )
+
+        candidates = {
+            "shell": lambda: Git.call_git_cmd("rev-parse HEAD", cwd=repo, shell=True),
+            "argv": lambda: Git.call_git_cmd(["rev-parse", "HEAD"], cwd=repo),
+        }
+        for name, func in candidates.items():
+            seconds = timeit(func, number=number)
+            print(f"{name:10} {seconds / number * 1e3:8.2f} ms/call")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 2000)
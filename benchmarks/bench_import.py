@@ -0,0 +1,63 @@
+"""
+Measure import time of frambo modules, i.e. what every worker/CLI pays on startup.
+
+Each module is imported in a fresh interpreter, the best of several runs
+minus interpreter startup time is reported, together with heavy dependencies
+the import pulled in. Use `python3 -X importtime -c 'import frambo.xyz'`
+to find out where the time goes.
+
+Usage: PYTHONPATH=. python3 benchmarks/bench_import.py [repeat]
+"""
+
+import subprocess
+import sys
+from time import perf_counter
+
+MODULES = [
+    "frambo.git",
+    "frambo.utils",
+    "frambo.config",
+    "frambo.pagure",
+    "frambo.emails",
+    "frambo.bot",
+]
+HEAVY = [
+    "yaml",
+    "jsonschema",
+    "jsl",
+    "requests",
+    "jinja2",
+    "celery",
+    "http.server",
+    "asyncio",
+]
+
+
+def best_of(code, repeat):
+    best = None
+    output = ""
+    for _ in range(repeat):
+        start = perf_counter()
+        output = subprocess.check_output(
+            [sys.executable, "-c", code], universal_newlines=True
+        )
+        elapsed = perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, output
+
+
+def main(repeat):
+    startup, _ = best_of("pass", repeat)
+    for module in MODULES:
+        seconds, loaded = best_of(
+            f"import sys, {module}; print(*(m for m in {HEAVY} if m in sys.modules))",
+            repeat,
+        )
+        print(
+            f"{module:15} {(seconds - startup) * 1e3:8.1f} ms"
+            f"   heavy: {loaded.strip() or '-'}"
+        )
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 5)
@@ -0,0 +1,41 @@
+"""
+Per-call cost of Bot logging for enabled and disabled levels.
+
+The bot logs at INFO level into an in-memory stream. "eager" is what
+every call used to cost: message formatting and JSON serialization
+before the logger checked whether the level is enabled.
+
+Usage: PYTHONPATH=. python3 benchmarks/bench_logging.py [number]
+"""
+
+from io import StringIO
+import logging
+import sys
+from timeit import timeit
+
+from frambo.bot import Bot
+from frambo.logger import Logger
+
+
+def main(number):
+    logger = Logger(task_name="task.bench.logging", level=logging.INFO, to_file=False)
+    logger.logger.addHandler(logging.StreamHandler(StringIO()))
+    logger.logger.propagate = False
+    bot = Bot(logger=logger)
+
+    def eager():
+        report_dict = {"message": logger.format("hello %s", ("world",))}
+        logger.logger.debug(logger.serialize(logging.DEBUG, report_dict))
+
+    candidates = {
+        "debug (disabled), eager": eager,
+        "debug (disabled)": lambda: bot.debug("hello %s", "world"),
+        "info (enabled)": lambda: bot.info("hello %s", "world"),
+    }
+    for name, func in candidates.items():
+        seconds = timeit(func, number=number)
+        print(f"{name:30} {seconds / number * 1e6:8.2f} us/call")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 20000)
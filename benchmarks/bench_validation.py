@@ -0,0 +1,36 @@
+"""
+Compare cost of bot-cfg.yml validation:
+jsonschema.validate() with schema generated on each call (the old way)
+vs. frambo.schemas.validate() with cached/compiled validators.
+
+Usage: PYTHONPATH=. python3 benchmarks/bench_validation.py [number]
+"""
+
+from pathlib import Path
+import sys
+from timeit import timeit
+
+import jsonschema
+from yaml import safe_load
+
+from frambo.schemas import BotCfg, get_compiled_validator, validate
+
+CFG = Path(__file__).parent.parent / "tests/data/bot-configs/bot-cfg.yml"
+
+
+def main(number):
+    instance = safe_load(CFG.read_text())
+    candidates = {
+        "jsonschema.validate(get_schema())": lambda: jsonschema.validate(
+            instance, BotCfg.get_schema()
+        ),
+        "frambo.schemas.validate()": lambda: validate(instance),
+    }
+    print(f"compiled validator: {'yes' if get_compiled_validator() else 'no'}")
+    for name, func in candidates.items():
+        seconds = timeit(func, number=number)
+        print(f"{name:40} {seconds / number * 1e6:10.1f} us/call")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 1000)
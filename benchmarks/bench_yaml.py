@@ -0,0 +1,48 @@
+"""
+Compare YAML parsing speed: yaml.safe_load() vs frambo.yaml_loader.load_yaml()
+(CSafeLoader if PyYAML is built with libyaml) over bot-cfg.yml files
+from tests & examples and frambo's own configuration.
+
+Usage: PYTHONPATH=. python3 benchmarks/bench_yaml.py [number]
+"""
+
+from pathlib import Path
+import sys
+from timeit import timeit
+
+import yaml
+
+from frambo.yaml_loader import get_yaml_parser, load_yaml
+
+ROOT = Path(__file__).parent.parent
+CORPUS = [
+    *sorted((ROOT / "tests/data/bot-configs").glob("*.yml")),
+    ROOT / "examples/cfg/bot-cfg.yml",
+    ROOT / "frambo/data/conf.d/config.yml",
+    ROOT / "frambo/data/defaults/conf-defaults-v1.yml",
+]
+
+
+def main(number):
+    print(f"libyaml: {'yes' if yaml.__with_libyaml__ else 'no'}")
+    print(f"parser: {get_yaml_parser().__module__}.{get_yaml_parser().__name__}")
+    totals = {"yaml.safe_load": 0, "load_yaml": 0}
+    for path in CORPUS:
+        text = path.read_text()
+        old = timeit(lambda: yaml.safe_load(text), number=number) / number
+        new = timeit(lambda: load_yaml(text), number=number) / number
+        totals["yaml.safe_load"] += old
+        totals["load_yaml"] += new
+        print(
+            f"{str(path.relative_to(ROOT)):45} {len(text):6} B"
+            f" {old * 1e6:9.1f} us {new * 1e6:9.1f} us  {old / new:5.1f}x"
+        )
+    print(
+        f"{'total':54} {totals['yaml.safe_load'] * 1e6:9.1f} us"
+        f" {totals['load_yaml'] * 1e6:9.1f} us"
+        f"  {totals['yaml.safe_load'] / totals['load_yaml']:5.1f}x"
+    )
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 200)
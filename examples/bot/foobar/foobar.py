@@ -16,6 +16,14 @@ class FooBarBot(Bot):
         self.tmpdir = TemporaryDirectory()
         self.tmpfile = None
 
+    def reset(self):
+        """Clean up after a task, the instance is reused by next one."""
+        super().reset()
+        # whatever the task left there, including subdirectories
+        self.tmpdir.cleanup()
+        self.tmpdir = TemporaryDirectory()
+        self.tmpfile = None
+
     def process(self, msg):
         """All task's work is done here."""
         self.debug("processing")
@@ -1,5 +1,6 @@
 # create app attribute which celery looks for during start
 from frambo.celery_app import app
+from frambo.pool import pooled
 from foobar.foobar import FooBarBot
 
 
@@ -9,7 +10,10 @@ from foobar.foobar import FooBarBot
 #   name: task name
 #         see http://docs.celeryproject.org/en/latest/userguide/tasks.html#names
 #         keep the 'task.yourbotname.taskname' scheme
+#
+# @pooled: run the task with a FooBarBot instance reused by tasks of this worker process,
+#          see frambo/pool.py and FooBarBot.reset()
 @app.task(name="task.foobar.rebuild_now")
-def rebuild_now(*args, **kwargs):
-    bot = FooBarBot(task_name="task.foobar.rebuild_now")
+@pooled(FooBarBot, task_name="task.foobar.rebuild_now")
+def rebuild_now(bot, *args, **kwargs):
     return bot.process(args[0])
@@ -1 +1,7 @@
-from frambo.celery_app import app
+def __getattr__(name):
+    # creating Celery app is expensive, do it only when somebody asks for it
+    if name == "app":
+        from frambo.celery_app import app
+
+        return app
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
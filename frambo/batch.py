@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+from collections import OrderedDict
+from logging import getLogger
+
+from frambo.pool import get_pool
+
+logger = getLogger(__name__)
+
+
+def group_messages(msgs, key, max_size=100):
+    """
+    Split messages to batches of messages with the same key.
+
+    :param msgs: iterable of messages
+    :param key: callable(msg) returning e.g. repo the msg is about
+    :param max_size: max number of messages in a batch
+    :return: list of lists of messages, in order of first occurrence of their key
+    """
+    if max_size < 1:
+        raise ValueError(f"max_size must be positive, got {max_size}")
+    groups = OrderedDict()
+    for msg in msgs:
+        groups.setdefault(key(msg), []).append(msg)
+    return [
+        group[i : i + max_size]
+        for group in groups.values()
+        for i in range(0, len(group), max_size)
+    ]
+
+
+def send_batches(app, task_name, msgs, key, max_size=100, **options):
+    """
+    Send messages as batches (grouped by key) to a task created by batch_task().
+
+    :param app: Celery app
+    :param task_name: name of the batch task
+    :param msgs: iterable of messages
+    :param key: callable(msg) returning e.g. repo the msg is about
+    :param max_size: max number of messages in a batch
+    :param options: passed to app.send_task(), e.g. queue
+    :return: list of AsyncResult, one per batch
+    """
+    return [
+        app.send_task(task_name, args=(batch,), **options)
+        for batch in group_messages(msgs, key, max_size=max_size)
+    ]
+
+
+def batch_task(app, name, bot_class, pool_size=4, **task_options):
+    """
+    Create Celery task processing a batch of messages by pooled bot_class instance.
+
+    The task returns a list with {"msg": ..., "result": ..., "error": ...}
+    for each message, see Bot.process_batch().
+
+    :param app: Celery app
+    :param name: task name
+    :param bot_class: Bot subclass, created with task_name=name
+    :param pool_size: max number of idle bots kept, see frambo/pool.py
+    :param task_options: passed to app.task()
+    :return: Celery task
+    """
+
+    def process_batch(msgs):
+        with get_pool(bot_class, size=pool_size, task_name=name).acquire() as bot:
+            return [result._asdict() for result in bot.process_batch(msgs)]
+
+    process_batch.__name__ = process_batch.__qualname__ = name.replace(".", "_")
+    return app.task(name=name, **task_options)(process_batch)
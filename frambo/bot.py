@@ -13,10 +13,26 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
+from collections import namedtuple
+from functools import wraps
 from logging import CRITICAL, ERROR, WARNING, INFO, DEBUG
+from pathlib import Path
 
-from frambo.config import fetch_config, load_configuration
-from frambo.logger import Logger
+from frambo.config import (
+    alias2key,
+    config_enabled,
+    fetch_config_file,
+    load_configuration,
+)
+from frambo.logger import get_logger
+from frambo.metrics import connect_signals, timed
+
+# workers export metrics of the phases timed below (and in config, git, utils, emails)
+connect_signals()
+
+
+# outcome of processing one message of a batch, error is repr() of the exception or None
+BatchResult = namedtuple("BatchResult", ["msg", "result", "error"])
 
 
 class Bot:
@@ -27,6 +43,12 @@ class Bot:
     # To be set in subclasses
     cfg_key = None
 
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        # measure each subclass' process()
+        if "process" in cls.__dict__:
+            cls.process = _timed_process(cls.__dict__["process"])
+
     def __init__(self, logger=None, task_name=None):
         """
         Initialize.
@@ -34,9 +56,62 @@ class Bot:
         :param logger: if a Bot (subclass) instance wants to use differently configured Logger
         :param task_name: str, for logging purposes, name of task which created this Bot instance
         """
-        self.logger = logger or Logger(task_name=task_name, level=DEBUG, to_file=False)
+        self.logger = logger or get_logger(
+            task_name=task_name, level=DEBUG, to_file=False
+        )
+        self.task_name = task_name
+        self.config = None
+
+    @property
+    def config(self):
+        """Bot's section of configuration, resolved on first access after is_enabled()."""
+        if self._config is None and self._conf_str is not None:
+            self._config = load_configuration(conf_str=self._conf_str)[
+                alias2key(self.cfg_key)
+            ]
+            self._conf_str = None
+        return self._config
+
+    @config.setter
+    def config(self, value):
+        self._config = value
+        self._conf_str = None
+
+    def checkout(self):
+        """
+        Prepare for a task, called when a pooled instance is taken (see frambo/pool.py).
+
+        Override to e.g. refresh state which might have become stale while idle.
+        """
+
+    def reset(self):
+        """
+        Forget per-task state, called when a pooled instance is returned (see frambo/pool.py).
+
+        Override to clean up whatever your bot leaves behind (temporary files, ...)
+        and call super().reset(). Keep the expensive state which can be reused.
+        """
         self.config = None
 
+    def process_batch(self, msgs):
+        """
+        Process messages one by one, a failure of one doesn't affect the others.
+
+        Override to do the work which all the messages share (e.g. clone the repo) only once.
+        See frambo/batch.py for how to create tasks which get batches of messages.
+
+        :param msgs: list of messages, as passed to process()
+        :return: list of BatchResult, in order of msgs
+        """
+        results = []
+        for msg in msgs:
+            try:
+                results.append(BatchResult(msg, self.process(msg), None))
+            except Exception as exc:
+                self.exception(exc)
+                results.append(BatchResult(msg, None, repr(exc)))
+        return results
+
     def is_enabled(self, config_url=None, config_path=None):
         """
         Is bot enabled in config ?
@@ -45,15 +120,27 @@ class Bot:
         if config_url and config_path:
             raise AttributeError("Provide EITHER config_url OR config_path")
 
+        with timed("is_enabled", self.task_name):
+            return self._is_enabled(config_url, config_path)
+
+    def _is_enabled(self, config_url, config_path):
         if config_url:
-            self.config = fetch_config(self.cfg_key, config_url)
+            conf_str = fetch_config_file(config_url)
         elif config_path:
-            self.config = load_configuration(config_path).get(self.cfg_key, {})
-
-        if not self.config:
-            raise RuntimeError("config has not been loaded yet")
-
-        return self.config.get("enabled", False)
+            if not Path(config_path).is_file():
+                raise AttributeError(f"Configuration file not found: {config_path}")
+            conf_str = Path(config_path).read_text()
+        else:
+            if not self.config:
+                raise RuntimeError("config has not been loaded yet")
+            return self.config.get("enabled", False)
+
+        # most repos have most bots disabled, don't resolve whole configuration
+        # just to find that out, the config property does that when needed
+        enabled = config_enabled(self.cfg_key, conf_str)
+        self.config = None
+        self._conf_str = conf_str
+        return enabled
 
     def log(self, level, msg, *args, **kwargs):
         """
@@ -67,6 +154,9 @@ class Bot:
         These attributes will be included in each logged message.
         See example/foobar/foobar.py.
 
+        It's called (by critical(), ..., debug()) only if the level is enabled,
+        so there's no need to check that here.
+
         :param level: logging level as defined in logging module
         :param msg: message to log
         :param args: arguments to msg
@@ -75,19 +165,33 @@ class Bot:
         self.logger.log(level, report_dict)
 
     def critical(self, msg, *args, **kwargs):
-        self.log(CRITICAL, msg, *args, **kwargs)
+        if self.logger.is_enabled_for(CRITICAL):
+            self.log(CRITICAL, msg, *args, **kwargs)
 
     def error(self, msg, *args, **kwargs):
-        self.log(ERROR, msg, *args, **kwargs)
+        if self.logger.is_enabled_for(ERROR):
+            self.log(ERROR, msg, *args, **kwargs)
 
     def warning(self, msg, *args, **kwargs):
-        self.log(WARNING, msg, *args, **kwargs)
+        if self.logger.is_enabled_for(WARNING):
+            self.log(WARNING, msg, *args, **kwargs)
 
     def info(self, msg, *args, **kwargs):
-        self.log(INFO, msg, *args, **kwargs)
+        if self.logger.is_enabled_for(INFO):
+            self.log(INFO, msg, *args, **kwargs)
 
     def debug(self, msg, *args, **kwargs):
-        self.log(DEBUG, msg, *args, **kwargs)
+        if self.logger.is_enabled_for(DEBUG):
+            self.log(DEBUG, msg, *args, **kwargs)
 
     def exception(self, exception):
         self.logger.logger.exception(exception)
+
+
+def _timed_process(process):
+    @wraps(process)
+    def wrapper(self, *args, **kwargs):
+        with timed("process", getattr(self, "task_name", None)):
+            return process(self, *args, **kwargs)
+
+    return wrapper
@@ -0,0 +1,190 @@
+# -*- coding: utf-8 -*-
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+from collections import Counter, OrderedDict, namedtuple
+from logging import getLogger
+from threading import RLock
+from time import monotonic
+
+logger = getLogger(__name__)
+
+# the only statuses which mean there's no file (any more)
+GONE_STATUSES = (404, 410)
+
+
+class LRUCache(object):
+    """Thread-safe mapping bounded to maxsize entries, evicting the least recently used."""
+
+    def __init__(self, maxsize=128):
+        """
+        Initialize.
+
+        :param maxsize: int, maximum number of entries kept
+        """
+        if maxsize < 1:
+            raise ValueError(f"maxsize must be positive, got {maxsize}")
+        self.maxsize = maxsize
+        self.stats = Counter()
+        self._data = OrderedDict()
+        self._lock = RLock()
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                self._data.move_to_end(key)
+            except KeyError:
+                self.stats["misses"] += 1
+                return default
+            self.stats["hits"] += 1
+            return self._data[key]
+
+    def put(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.stats["evictions"] += 1
+
+    def pop(self, key, default=None):
+        with self._lock:
+            return self._data.pop(key, default)
+
+    def resize(self, maxsize):
+        """Change maxsize, evicting least recently used entries if needed."""
+        if maxsize < 1:
+            raise ValueError(f"maxsize must be positive, got {maxsize}")
+        with self._lock:
+            self.maxsize = maxsize
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.stats["evictions"] += 1
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.stats.clear()
+
+
+CachedResponse = namedtuple(
+    "CachedResponse", ["text", "etag", "last_modified", "fetched"]
+)
+
+
+class ConfigCache(object):
+    """
+    Cache of remote configuration files keyed by URL.
+
+    Fresh entries (younger than ttl) are returned without any request,
+    older ones are revalidated with If-None-Match/If-Modified-Since
+    so that an unchanged file costs only a '304 Not Modified' round trip.
+    """
+
+    def __init__(self, maxsize=256, ttl=300, serve_stale=True, clock=monotonic):
+        """
+        Initialize.
+
+        :param maxsize: int, maximum number of cached files
+        :param ttl: seconds for which a cached file is used without revalidation
+        :param serve_stale: bool, return cached file when the server fails
+        :param clock: callable returning current time in seconds
+        """
+        self.ttl = ttl
+        self.serve_stale = serve_stale
+        self.stats = Counter()
+        self._entries = LRUCache(maxsize)
+        self._clock = clock
+
+    def __len__(self):
+        return len(self._entries)
+
+    def configure(self, maxsize=None, ttl=None, serve_stale=None):
+        """Change settings, keeping cached files."""
+        if maxsize is not None:
+            self._entries.resize(maxsize)
+        if ttl is not None:
+            self.ttl = ttl
+        if serve_stale is not None:
+            self.serve_stale = serve_stale
+
+    def get(self, url, fetch):
+        """
+        Return content of file at url, using fetch() only when needed.
+
+        :param url: str, url of the file
+        :param fetch: callable(url, headers) returning requests.Response-like object
+        :return: str, or None if there's no such file
+        """
+        entry = self._entries.get(url)
+        if entry and self._clock() - entry.fetched < self.ttl:
+            self.stats["hits"] += 1
+            return entry.text
+
+        headers = {}
+        if entry:
+            self.stats["revalidations"] += 1
+            if entry.etag:
+                headers["If-None-Match"] = entry.etag
+            if entry.last_modified:
+                headers["If-Modified-Since"] = entry.last_modified
+        else:
+            self.stats["misses"] += 1
+
+        try:
+            response = fetch(url, headers)
+        except OSError as exc:
+            # requests.RequestException is an OSError as well
+            if entry and self.serve_stale:
+                return self._stale(url, entry, exc)
+            raise
+
+        if response.status_code == 304 and entry:
+            self.stats["not_modified"] += 1
+            self._entries.put(url, entry._replace(fetched=self._clock()))
+            return entry.text
+        if response.status_code == 200:
+            self._entries.put(
+                url,
+                CachedResponse(
+                    text=response.text,
+                    etag=response.headers.get("ETag"),
+                    last_modified=response.headers.get("Last-Modified"),
+                    fetched=self._clock(),
+                ),
+            )
+            return response.text
+        if response.status_code in GONE_STATUSES:
+            # the file is gone (or has never been there)
+            self._entries.pop(url)
+            return None
+        # server error, rate limiting, authorization... says nothing about the file
+        if entry and self.serve_stale:
+            return self._stale(url, entry, response.status_code)
+        return None
+
+    def _stale(self, url, entry, reason):
+        self.stats["stale"] += 1
+        logger.warning(f"Failed to revalidate {url} ({reason}), using cached file")
+        return entry.text
+
+    def clear(self):
+        self._entries.clear()
+        self.stats.clear()
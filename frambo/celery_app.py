@@ -32,6 +32,16 @@ def configure_sentry(dsn=None):
     register_signal(client)
 
 
+def redis_url():
+    """Return url of Redis, as set by REDIS_SERVICE_* environment variables."""
+    redis_host = getenv("REDIS_SERVICE_HOST", "redis")
+    redis_port = getenv("REDIS_SERVICE_PORT", "6379")
+    redis_db = getenv("REDIS_SERVICE_DB", "0")
+    return "redis://{host}:{port}/{db}".format(
+        host=redis_host, port=redis_port, db=redis_db
+    )
+
+
 def celery_app(include=None):
     """
     Create Celery instance. Take broker/backend url from environment.
@@ -40,15 +50,9 @@ def celery_app(include=None):
     you don't need to specify anything in 'include'. But if the xyz is a package then you need to
     specify all modules from the package here.
     """
-    redis_host = getenv("REDIS_SERVICE_HOST", "redis")
-    redis_port = getenv("REDIS_SERVICE_PORT", "6379")
-    redis_db = getenv("REDIS_SERVICE_DB", "0")
-    redis_url = "redis://{host}:{port}/{db}".format(
-        host=redis_host, port=redis_port, db=redis_db
-    )
-
+    url = redis_url()
     # http://docs.celeryproject.org/en/latest/reference/celery.html#celery.Celery
-    return Celery(backend=redis_url, broker=redis_url, include=include)
+    return Celery(backend=url, broker=url, include=include)
 
 
 app = celery_app()
@@ -0,0 +1,158 @@
+# -*- coding: utf-8 -*-
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+from logging import getLogger
+from threading import Lock
+from time import monotonic
+
+from frambo.config import get_from_frambo_config
+from frambo.metrics import registry
+
+logger = getLogger(__name__)
+
+COALESCED_EVENTS = "frambo_coalesced_events_total"
+registry.describe(
+    COALESCED_EVENTS, "Number of events which didn't cause another bot run."
+)
+
+
+class MemoryBackend(object):
+    """Keys with expiration in memory of this process, for tests and single-process setups."""
+
+    def __init__(self, clock=monotonic):
+        self._expires = {}
+        self._lock = Lock()
+        self._clock = clock
+
+    def add(self, key, ttl):
+        """
+        Set key for ttl seconds, unless it's already set.
+
+        :return: bool, was it set ?
+        """
+        now = self._clock()
+        with self._lock:
+            if self._expires.get(key, now) > now:
+                return False
+            self._expires[key] = now + ttl
+            if len(self._expires) > 1000:
+                # forget the expired ones once in a while
+                self._expires = {k: t for k, t in self._expires.items() if t > now}
+            return True
+
+    def delete(self, key):
+        with self._lock:
+            self._expires.pop(key, None)
+
+
+class RedisBackend(object):
+    """Keys with expiration in Redis, shared by all workers."""
+
+    def __init__(self, client=None):
+        """
+        Initialize.
+
+        :param client: redis.Redis, defaults to the Redis used by Celery
+        """
+        if client is None:
+            from redis import Redis
+            from frambo.celery_app import redis_url
+
+            client = Redis.from_url(redis_url())
+        self.client = client
+
+    def add(self, key, ttl):
+        """
+        Set key for ttl seconds, unless it's already set.
+
+        :return: bool, was it set ?
+        """
+        return bool(self.client.set(key, 1, nx=True, px=max(1, int(ttl * 1000))))
+
+    def delete(self, key):
+        self.client.delete(key)
+
+
+class Coalescer(object):
+    """
+    Debounce bot runs: events for the same bot, repo and branch which come
+    within window seconds are handled by one run, started when the window ends.
+    """
+
+    def __init__(self, backend=None, window=None, prefix="frambo:coalesce"):
+        """
+        Initialize.
+
+        :param backend: MemoryBackend or RedisBackend (default)
+        :param window: seconds, defaults to coalesce:window from frambo config
+        :param prefix: prefix of the keys
+        """
+        self.backend = backend or RedisBackend()
+        if window is None:
+            window = get_from_frambo_config(
+                "coalesce", "window", default=30, raises=False
+            )
+        self.window = window
+        self.prefix = prefix
+
+    def key(self, bot_key, repo, branch):
+        return f"{self.prefix}:{bot_key}:{repo}:{branch}"
+
+    def claim(self, bot_key, repo, branch, ttl=None):
+        """
+        Should this event start a (delayed) run or is there one already ?
+
+        :param ttl: seconds until the run starts, defaults to window
+        :return: bool, True if the caller should schedule run after ttl seconds
+        """
+        ttl = self.window if ttl is None else ttl
+        if self.backend.add(self.key(bot_key, repo, branch), ttl):
+            return True
+        logger.debug(f"{bot_key} run for {repo}:{branch} is already scheduled")
+        registry.inc(COALESCED_EVENTS, bot=bot_key)
+        return False
+
+    def release(self, bot_key, repo, branch):
+        """
+        Let the next event schedule another run.
+
+        The task sent by send_task() should call this before it reads the repo state.
+        Otherwise events which come after it started, but before the key expires
+        (the worker's clock is ahead of Redis' or the task starts a bit early),
+        are coalesced into a run which doesn't see them.
+        """
+        self.backend.delete(self.key(bot_key, repo, branch))
+
+    def send_task(self, app, task_name, bot_key, repo, branch, **options):
+        """
+        Send task, which will run once window ends, unless it's already been sent.
+
+        The task shouldn't rely on message content which can change between events,
+        since it handles all of them, e.g. it should take the branch head when it runs.
+        It should call release() before that.
+
+        :param app: Celery app
+        :param task_name: name of the task
+        :param bot_key: bot configuration key
+        :param repo: repository
+        :param branch: branch
+        :param options: passed to app.send_task(), e.g. args, queue,
+                        countdown defaults to window
+        :return: AsyncResult, or None if the event has been coalesced
+        """
+        countdown = options.pop("countdown", self.window)
+        if not self.claim(bot_key, repo, branch, ttl=countdown):
+            return None
+        return app.send_task(task_name, countdown=countdown, **options)
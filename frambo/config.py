@@ -1,41 +1,192 @@
 #!/usr/bin/env python3
 
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, as_completed
 import copy
 from functools import lru_cache
+from hashlib import sha256
 import json
-import jsonschema
 import logging
+import os
 from os import getenv
 from pathlib import Path
-import requests
 import sys
-import yaml
+from threading import RLock
+from time import monotonic
 
 from typing import Any
 
-from frambo.schemas import BotCfg
+from frambo.cache import ConfigCache, LRUCache
+from frambo.metrics import timed
+from frambo.utils import FrozenDict, freeze
+from frambo.yaml_loader import load_yaml
 
 BASE_PATH = Path(__file__).parent
 DATA_PATH = BASE_PATH / "data"
 CONFIG_DIR = DATA_PATH / "conf.d"
 DEFAULTS_PATH = DATA_PATH / "defaults/conf-defaults-v1.yml"
 
-DEPLOYMENT = getenv("DEPLOYMENT")
-if not DEPLOYMENT:
-    raise ValueError("Please set DEPLOYMENT environment variable.")
-
 logger = logging.getLogger(__name__)
 
 
-@lru_cache(maxsize=4)
-def frambo_config(cfgdir=CONFIG_DIR):
+class Settings(object):
+    """
+    Values derived from frambo configuration, evaluated on first access.
+
+    Modules register factories of their settings with @settings.register(NAME),
+    the value is then available as settings.NAME and computed only once,
+    i.e. until frambo configuration changes. Accessing settings.NAME is as cheap
+    as accessing any attribute, the configuration file is checked for changes
+    whenever it's read (frambo_config()), e.g. in load_configuration().
+    """
+
+    def __init__(self):
+        self._factories = {}
+        self._keep = set()
+        self._reload_hooks = []
+        self._lock = RLock()
+
+    def register(self, name, keep=False):
+        """
+        Register factory of setting.
+
+        :param name: str, name of the setting
+        :param keep: bool, keep the value when configuration changes,
+                     for stateful values like caches, see on_reload()
+        """
+
+        def decorator(factory):
+            self._factories[name] = factory
+            if keep:
+                self._keep.add(name)
+            return factory
+
+        return decorator
+
+    def on_reload(self, hook):
+        """Register function to be called (without arguments) when configuration changes."""
+        self._reload_hooks.append(hook)
+        return hook
+
+    def __getattr__(self, name):
+        # called only for settings which haven't been computed yet
+        try:
+            factory = self._factories[name]
+        except KeyError:
+            raise AttributeError(f"Unknown setting {name!r}") from None
+        with self._lock:
+            if name not in self.__dict__:
+                self.__dict__[name] = factory()
+            return self.__dict__[name]
+
+    def reset(self):
+        """Forget computed values, they'll be computed again on next access."""
+        with self._lock:
+            for name in set(self._factories) - self._keep:
+                self.__dict__.pop(name, None)
+        for hook in self._reload_hooks:
+            hook()
+
+
+settings = Settings()
+
+
+def lazy_module_attributes(module_name, names):
+    """
+    Return module-level __getattr__ (PEP 562) which looks the names up in settings.
+    Allows e.g. `from frambo.config import BOT_CONF_KEYS` without computing it on import.
+    """
+
+    def __getattr__(name):
+        if name in names:
+            # cheap, the file is checked at most once per config:reload-interval
+            frambo_config()
+            return getattr(settings, name)
+        raise AttributeError(f"module {module_name!r} has no attribute {name!r}")
+
+    return __getattr__
+
+
+__getattr__ = lazy_module_attributes(
+    __name__,
+    (
+        "DEPLOYMENT",
+        "BOT_CONF_KEYS_ALIASES",
+        "BOT_CONF_KEYS",
+        "CONFIG_CACHE",
+        "RESOLVED_CACHE",
+    ),
+)
+
+
+@settings.register("DEPLOYMENT")
+def _deployment():
+    deployment = getenv("DEPLOYMENT")
+    if not deployment:
+        raise ValueError("Please set DEPLOYMENT environment variable.")
+    return deployment
+
+
+LoadedConfig = namedtuple("LoadedConfig", ["config", "signature", "next_check"])
+
+_loaded_configs = {}
+_loaded_configs_lock = RLock()
+
+
+def _signature(path):
+    stat = os.stat(path)
+    return stat.st_mtime_ns, stat.st_size, stat.st_ino
+
+
+def frambo_config(cfgdir=None):
     """
     Load & return frambo configuration from cfgdir.
-    :param cfgdir: pathlike
+
+    The configuration is cached and the file is checked for changes (by stat)
+    at most once per config:reload-interval seconds. When it has changed,
+    it's reloaded and, for the default cfgdir, settings are reset.
+
+    :param cfgdir: pathlike, defaults to CONFIG_DIR
     """
-    cfgfile = cfgdir / "config.yml"
+    # hot path, avoid even building the path
+    loaded = _loaded_configs.get(cfgdir)
+    if loaded and monotonic() < loaded.next_check:
+        return loaded.config
+
+    cfgfile = Path(cfgdir or CONFIG_DIR) / "config.yml"
+    reloaded = False
+    with _loaded_configs_lock:
+        loaded = _loaded_configs.get(cfgdir)
+        now = monotonic()
+        if loaded and now < loaded.next_check:
+            return loaded.config
+
+        config = loaded.config if loaded else None
+        try:
+            signature = _signature(cfgfile)
+            if not loaded or loaded.signature != signature:
+                config = _load_frambo_config(cfgfile)
+                reloaded = bool(loaded)
+        except Exception:
+            if not loaded:
+                raise
+            # probably caught in the middle of editing (or of replacing the file),
+            # try again later
+            logger.exception(f"Failed to reload {cfgfile}, keeping the old one")
+            signature = loaded.signature
+
+        interval = config.get("config", {}).get("reload-interval", 1)
+        _loaded_configs[cfgdir] = LoadedConfig(config, signature, now + interval)
+
+    if reloaded and not cfgdir:
+        logger.info(f"{cfgfile} has changed, settings reloaded")
+        settings.reset()
+    return config
+
+
+def _load_frambo_config(cfgfile):
     logger.info(f"Loading frambo config: {cfgfile}")
-    config = yaml.safe_load(open(cfgfile))
+    config = load_yaml(Path(cfgfile).read_text())
     if not config:
         raise ValueError("No frambo config found")
 
@@ -47,13 +198,20 @@ def frambo_config(cfgdir=CONFIG_DIR):
                     raise ValueError(f"No 'deployment' in {entry}")
                 if not isinstance(entry["deployment"], list):
                     entry["deployment"] = [entry["deployment"]]
-                if DEPLOYMENT in entry["deployment"]:
+                if _deployment() in entry["deployment"]:
                     entry.pop("deployment")
                     config[module] = entry
                     break
     return config
 
 
+def reset_frambo_config():
+    """Forget all loaded frambo configurations and settings derived from them."""
+    with _loaded_configs_lock:
+        _loaded_configs.clear()
+    settings.reset()
+
+
 def get_from_frambo_config(
     module: str,
     key: str,
@@ -66,12 +224,71 @@ def get_from_frambo_config(
     return frambo_config().get(module, {}).get(key, default)
 
 
-BOT_CONF_KEYS_ALIASES = get_from_frambo_config("config", "bot-conf-keys-aliases")
-BOT_CONF_KEYS = set(BOT_CONF_KEYS_ALIASES.values())
+@settings.register("BOT_CONF_KEYS_ALIASES")
+def _bot_conf_keys_aliases():
+    return get_from_frambo_config("config", "bot-conf-keys-aliases")
+
+
+@settings.register("BOT_CONF_KEYS")
+def _bot_conf_keys():
+    return set(settings.BOT_CONF_KEYS_ALIASES.values())
+
+
+def _config_cache_options():
+    return dict(
+        maxsize=get_from_frambo_config(
+            "config", "cache-size", default=256, raises=False
+        ),
+        ttl=get_from_frambo_config("config", "cache-ttl", default=300, raises=False),
+        serve_stale=get_from_frambo_config(
+            "config", "cache-serve-stale", default=True, raises=False
+        ),
+    )
+
+
+def _resolved_cache_size():
+    return get_from_frambo_config(
+        "config", "resolved-cache-size", default=512, raises=False
+    )
+
+
+# bot-cfg.yml files fetched by fetch_config(), see ConfigCache
+@settings.register("CONFIG_CACHE", keep=True)
+def _config_cache():
+    return ConfigCache(**_config_cache_options())
+
+
+# load_configuration() results keyed by hash of bot-cfg.yml content and defaults
+@settings.register("RESOLVED_CACHE", keep=True)
+def _resolved_cache():
+    return LRUCache(maxsize=_resolved_cache_size())
+
+
+@settings.register("ENABLED_CACHE", keep=True)
+def _enabled_cache():
+    return LRUCache(maxsize=_resolved_cache_size())
+
+
+@settings.on_reload
+def _reconfigure_caches():
+    # fetched files don't depend on frambo config, keep them,
+    # resolved configurations depend on bot-conf-keys-aliases, drop them
+    settings.CONFIG_CACHE.configure(**_config_cache_options())
+    for cache in (settings.RESOLVED_CACHE, settings.ENABLED_CACHE):
+        cache.clear()
+        cache.resize(_resolved_cache_size())
 
 
 def alias2key(alias):
-    return BOT_CONF_KEYS_ALIASES.get(alias, alias)
+    return settings.BOT_CONF_KEYS_ALIASES.get(alias, alias)
+
+
+def _writable(dct, key):
+    """Copy-on-write: replace read-only dct[key] with its (shallow) writable copy."""
+    value = dct[key]
+    if isinstance(value, FrozenDict):
+        value = dct[key] = dict(value)
+    return value
 
 
 def dict_merge(into_dct, from_dct):
@@ -86,49 +303,223 @@ def dict_merge(into_dct, from_dct):
     for k, v in from_dct.items():
         k = alias2key(k)
         if isinstance(into_dct.get(k), dict) and isinstance(v, dict):
-            dict_merge(into_dct[k], v)
+            dict_merge(_writable(into_dct, k), v)
         else:
             into_dct[k] = copy.deepcopy(v) if isinstance(v, dict) else v
 
 
+def _has_aliases(dct, aliases):
+    """Is any of aliases used as a key in dct or in any dict nested in it ?"""
+    return any(
+        k in aliases or (isinstance(v, dict) and _has_aliases(v, aliases))
+        for k, v in dct.items()
+    )
+
+
+def _merge(into_dct, from_dct, aliases):
+    result = dict(into_dct)
+    for k, v in from_dct.items():
+        if aliases:
+            k = aliases.get(k, k)
+        current = result.get(k)
+        if isinstance(current, dict) and isinstance(v, dict):
+            result[k] = _merge(current, v, aliases)
+        else:
+            result[k] = v
+    return result
+
+
+def merge_dicts(into_dct, from_dct):
+    """
+    Same as dict_merge(), but instead of merging ``from_dct`` into ``into_dct``
+    in place, return the result and leave both of them untouched.
+
+    Nothing is deep-copied, only dicts along the merged paths are new,
+    the rest is shared with ``into_dct`` and ``from_dct``, so the result
+    shouldn't be modified, freeze() it. Aliases (see alias2key()) are looked up
+    only if ``from_dct`` contains any.
+
+    :param into_dct: dict, onto which the merge is executed
+    :param from_dct: dict, merged into into_dct
+    :return: dict
+    """
+    aliases = settings.BOT_CONF_KEYS_ALIASES
+    return _merge(
+        into_dct, from_dct, aliases if _has_aliases(from_dct, aliases) else None
+    )
+
+
+def merge_configuration(defaults, repo_conf):
+    """
+    Merge bot-cfg.yml into defaults, see merge_dicts().
+
+    The 'global' section is merged into each bot's section present in defaults,
+    then the rest of repo_conf into the result.
+
+    :param defaults: dict, default configuration
+    :param repo_conf: dict, content of bot-cfg.yml
+    :return: dict
+    """
+    result = dict(defaults)
+
+    global_conf = repo_conf.get("global", {})
+    if not isinstance(global_conf, dict):
+        # 'global' key has probably just some non-dict value like None or '', no need to raise
+        logger.error(f"Wrong 'global' value: {global_conf}")
+    elif global_conf:
+        aliases = settings.BOT_CONF_KEYS_ALIASES
+        if not _has_aliases(global_conf, aliases):
+            aliases = None
+        for key in settings.BOT_CONF_KEYS:
+            if isinstance(result.get(key), dict):
+                result[key] = _merge(result[key], global_conf, aliases)
+
+    # 'global' has been merged into others, we don't need it anymore
+    repo_conf = {k: v for k, v in repo_conf.items() if k != "global"}
+
+    # overwrite defaults with values in bot configuration
+    return merge_dicts(result, repo_conf)
+
+
 def pretty_dict(report_dict):
     result = json.dumps(report_dict, sort_keys=True, indent=4)
     result = result.replace("\\n", "\n")
     return result
 
 
-def fetch_config(config_key, config_file_url):
+def _get_config_file(url, headers):
+    # frambo.http_client reads its settings from here
+    from frambo.http_client import get_session
+
+    return get_session().get(
+        url, headers=headers, cookies={"pagure": "user-cont-bot-cfg-load"}
+    )
+
+
+def _check_config_key(config_key):
+    # pick up changes of frambo configuration, cheap, see frambo_config()
+    frambo_config()
     if not config_key:
         raise AttributeError(
             "No configuration key."
             "You probably need to set bot_cfg attribute in your bot."
         )
-    if alias2key(config_key) not in BOT_CONF_KEYS:
+    if alias2key(config_key) not in settings.BOT_CONF_KEYS:
         raise AttributeError(
             f"Unknown bot configuration key {config_key!r}."
-            f"Supported are: {BOT_CONF_KEYS}."
+            f"Supported are: {settings.BOT_CONF_KEYS}."
         )
 
-    bots_config = ""
+
+def fetch_configuration(config_file_url):
+    """
+    Fetch bot-cfg.yml and return it merged with defaults, see load_configuration().
+    Default configuration is returned if there's no file at config_file_url.
+    """
+    return load_configuration(conf_str=fetch_config_file(config_file_url))
+
+
+def fetch_config_file(config_file_url):
+    """
+    Fetch bot-cfg.yml, see settings.CONFIG_CACHE.
+
+    :return: str, content of the file, empty if there's no file at config_file_url
+    """
     logger.info(f"Pulling config file: {config_file_url}")
-    r = requests.get(config_file_url, cookies={"pagure": "user-cont-bot-cfg-load"})
-    if r.status_code == 200:
-        bots_config = r.text
+    with timed("config_fetch"):
+        bots_config = settings.CONFIG_CACHE.get(config_file_url, _get_config_file)
+    if bots_config is not None:
         logger.debug("Bot configuration fetched")
     else:
+        bots_config = ""
         logger.warning(
             f"Config file not found in url: {config_file_url}, "
             "using default configuration."
         )
+    return bots_config
 
-    conf_with_defaults = load_configuration(conf_str=bots_config)
+
+def fetch_config(config_key, config_file_url):
+    _check_config_key(config_key)
+    conf_with_defaults = fetch_configuration(config_file_url)
     return conf_with_defaults[alias2key(config_key)]
 
 
+ConfigResult = namedtuple("ConfigResult", ["repo", "config", "error"])
+
+
+def fetch_configs(config_file_urls, config_key=None, max_workers=None):
+    """
+    Fetch & resolve configurations of many repositories concurrently.
+
+    Results are yielded as soon as they're ready, i.e. not in order of config_file_urls.
+    Failure to get one configuration doesn't affect the others,
+    the exception is returned in ConfigResult.error instead.
+
+    :param config_file_urls: dict, repo: url of its bot-cfg.yml
+    :param config_key: return only this bot's configuration instead of the whole one
+    :param max_workers: max number of configurations fetched at once,
+                        defaults to config:fetch-workers from frambo config
+    :return: generator of ConfigResult(repo, config, error) tuples
+    """
+    if config_key:
+        _check_config_key(config_key)
+        config_key = alias2key(config_key)
+    max_workers = max_workers or get_from_frambo_config(
+        "config", "fetch-workers", default=16, raises=False
+    )
+
+    def fetch(url):
+        conf = fetch_configuration(url)
+        return conf[config_key] if config_key else conf
+
+    executor = ThreadPoolExecutor(max_workers=max_workers)
+    futures = {
+        executor.submit(fetch, url): repo for repo, url in config_file_urls.items()
+    }
+    try:
+        for future in as_completed(futures):
+            repo = futures[future]
+            try:
+                yield ConfigResult(repo, future.result(), None)
+            except Exception as exc:
+                logger.warning(f"Failed to get configuration of {repo}: {exc!r}")
+                yield ConfigResult(repo, None, exc)
+    finally:
+        # the caller might not want the rest
+        for future in futures:
+            future.cancel()
+        executor.shutdown(wait=False)
+
+
+@lru_cache(maxsize=1)
+def load_defaults():
+    """
+    Load & return default bots configuration.
+    It's parsed only once, hence it's read-only, see FrozenDict.
+    """
+    return freeze(load_yaml(DEFAULTS_PATH.read_text()))
+
+
+@lru_cache(maxsize=1)
+def defaults_version():
+    """Return hash of default bots configuration."""
+    return sha256(DEFAULTS_PATH.read_bytes()).hexdigest()
+
+
 def load_configuration(conf_path=None, conf_str=None):
-    # load defaults
-    result = yaml.safe_load(open(DEFAULTS_PATH))
-    # logger.debug(f"Default bots configuration: {pretty_dict(result)}")
+    """
+    Load bots configuration and fill in defaults.
+
+    Resolved configurations are cached (see settings.RESOLVED_CACHE) by hash of conf_str
+    and defaults, so they're read-only, see FrozenDict.
+
+    :param conf_path: path to bot-cfg.yml
+    :param conf_str: str, content of bot-cfg.yml
+    :return: FrozenDict
+    """
+    # pick up changes of frambo configuration, cheap, see frambo_config()
+    frambo_config()
 
     if conf_str and conf_path:
         raise AttributeError(
@@ -139,44 +530,110 @@ def load_configuration(conf_path=None, conf_str=None):
     if not (conf_str or conf_path):
         # none provided, return default config
         logger.info("No config provided, using default")
-        return result
+        return load_defaults()
 
     if conf_path:
         if not Path(conf_path).is_file():
             raise AttributeError(f"Configuration file not found: {conf_path}")
         conf_str = Path(conf_path).read_text()
 
+    key = sha256(f"{defaults_version()}:{conf_str}".encode()).hexdigest()
+    result = settings.RESOLVED_CACHE.get(key)
+    if result is None:
+        result = freeze(_resolve_configuration(conf_str))
+        settings.RESOLVED_CACHE.put(key, result)
+    else:
+        logger.debug("Using cached bots configuration")
+    return result
+
+
+def config_enabled(config_key, conf_str):
+    """
+    Is the bot enabled in configuration ? Like load_configuration()[config_key]["enabled"],
+    but without merging and validating the whole configuration,
+    which is left to load_configuration() once the bot really needs it.
+
+    :param config_key: bot configuration key
+    :param conf_str: str, content of bot-cfg.yml
+    :return: value of 'enabled'
+    """
+    _check_config_key(config_key)
+    key = alias2key(config_key)
+    if not conf_str:
+        return load_defaults()[key].get("enabled", False)
+
+    cache_key = sha256(f"{defaults_version()}:{conf_str}".encode()).hexdigest()
+    resolved = settings.RESOLVED_CACHE.get(cache_key)
+    if resolved is not None:
+        return resolved[key].get("enabled", False)
+
+    enabled = settings.ENABLED_CACHE.get((cache_key, key))
+    if enabled is None:
+        enabled = _enabled(key, load_yaml(conf_str.replace("\t\n", "\n")))
+        if enabled is None:
+            # unusual configuration, let load_configuration() deal with it
+            enabled = load_configuration(conf_str=conf_str)[key].get("enabled", False)
+        settings.ENABLED_CACHE.put((cache_key, key), enabled)
+    return enabled
+
+
+def _enabled(key, repo_conf):
+    """
+    Return 'enabled' of bot's section as merge_configuration() would set it,
+    None if it's not that simple (or the value isn't valid).
+    """
+    section = load_defaults().get(key)
+    if not isinstance(repo_conf, dict) or not isinstance(section, (dict, type(None))):
+        return None
+    aliases = settings.BOT_CONF_KEYS_ALIASES
+    found = section is not None
+    enabled = section.get("enabled", False) if found else False
+
+    global_conf = repo_conf.get("global")
+    # merged only into sections present in defaults
+    if found and isinstance(global_conf, dict):
+        for k, v in global_conf.items():
+            if aliases.get(k, k) == "enabled":
+                enabled = v
+
+    for bot_key, bot_conf in repo_conf.items():
+        if bot_key == "global" or aliases.get(bot_key, bot_key) != key:
+            continue
+        if not isinstance(bot_conf, dict):
+            return None
+        found = True
+        for k, v in bot_conf.items():
+            if aliases.get(k, k) == "enabled":
+                enabled = v
+
+    return enabled if found and isinstance(enabled, bool) else None
+
+
+@timed("config_resolve")
+def _resolve_configuration(conf_str):
+    from frambo.schemas import validate
+
     # Some people keep putting tabs at the end of lines
     conf_str = conf_str.replace("\t\n", "\n")
 
-    repo_conf = yaml.safe_load(conf_str)
+    repo_conf = load_yaml(conf_str)
 
     for bot_key in repo_conf.keys():
-        if alias2key(bot_key) not in BOT_CONF_KEYS.union({"version", "global"}):
+        if alias2key(bot_key) not in settings.BOT_CONF_KEYS.union(
+            {"version", "global"}
+        ):
             logger.warning(
                 f"Provided unsupported key value: {bot_key}. "
-                f"Supported are: {BOT_CONF_KEYS}."
+                f"Supported are: {settings.BOT_CONF_KEYS}."
             )
 
-    # fill global values
-    for key in BOT_CONF_KEYS:
-        try:
-            dict_merge(
-                into_dct=result.get(key, {}), from_dct=repo_conf.get("global", {})
-            )
-        except AttributeError:
-            # 'global' key has probably just some non-dict value like None or '', no need to raise
-            logger.error(f"Wrong 'global' value: {repo_conf['global']}")
-    # 'global' has been merged into others, we don't need it anymore
-    repo_conf.pop("global", None)
-
-    # overwrite defaults with values in bot configuration
-    dict_merge(into_dct=result, from_dct=repo_conf)
+    result = merge_configuration(load_defaults(), repo_conf)
 
     # validate
-    jsonschema.validate(result, BotCfg.get_schema())
+    validate(result)
 
-    logger.debug(f"Resulting bots configuration: {pretty_dict(result)}")
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug(f"Resulting bots configuration: {pretty_dict(result)}")
 
     return result
 
@@ -4,29 +4,42 @@ from email.mime.multipart import MIMEMultipart
 from email.utils import COMMASPACE, formatdate
 from email.mime.text import MIMEText
 
-from frambo.config import get_from_frambo_config
+from frambo.config import get_from_frambo_config, lazy_module_attributes, settings
+from frambo.metrics import timed
 from frambo.utils import text_from_template
 
-SENDER = get_from_frambo_config("emails", "sender")
-SMTP_SERVER = get_from_frambo_config("emails", "smtp_server")
+__getattr__ = lazy_module_attributes(__name__, ("SENDER", "SMTP_SERVER"))
 
 logger = getLogger(__name__)
 
 
+@settings.register("SENDER")
+def _sender():
+    return get_from_frambo_config("emails", "sender")
+
+
+@settings.register("SMTP_SERVER")
+def _smtp_server():
+    return get_from_frambo_config("emails", "smtp_server")
+
+
 def build_email_message(template_dir, template_filename, template_data):
     """Redirect"""
     return text_from_template(template_dir, template_filename, template_data)
 
 
-def send_email(text, receivers, subject, sender=SENDER, smtp_server=SMTP_SERVER):
+@timed("email_send")
+def send_email(text, receivers, subject, sender=None, smtp_server=None):
     """
     Send an email from SENDER_EMAIL to all provided receivers
     :param text: string, body of email
     :param receivers: list, email receivers
     :param subject: string, email subject
-    :param sender: string, sender email
-    :param smtp_server: string, smtp server hostname
+    :param sender: string, sender email, defaults to SENDER
+    :param smtp_server: string, smtp server hostname, defaults to SMTP_SERVER
     """
+    sender = sender or settings.SENDER
+    smtp_server = smtp_server or settings.SMTP_SERVER
     logger.info("Sending email to: %s", str(receivers))
 
     msg = MIMEMultipart()
@@ -12,45 +12,141 @@
 #
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
+import atexit
+from collections import namedtuple, OrderedDict
+from contextlib import contextmanager
+import fcntl
+from functools import lru_cache
+from hashlib import sha256
 from logging import getLogger
+import os
 from pathlib import Path
+from shlex import quote, split
+from shutil import rmtree
+import signal
+import subprocess
+from tempfile import mkdtemp
+from threading import Lock
+from time import monotonic
 from urllib.parse import urlparse
 
+from frambo.config import get_from_frambo_config
+from frambo.metrics import timed
 from frambo.utils import run_cmd
 
 logger = getLogger(__name__)
 
+# outcome of a git command run by AsyncGit, rc is None when it timed out
+GitResult = namedtuple("GitResult", ["args", "rc", "stdout", "stderr", "duration"])
+
+# number of URLs Git.parse_git_repo() remembers
+PARSE_CACHE_SIZE = 4096
+
+
+def _git_command(git_dir=None):
+    command = ["git"]
+    # use git_dir as work-tree git parameter and git-dir parameter (with added git.postfix)
+    if git_dir:
+        command += ["--git-dir", f"{git_dir}/.git", "--work-tree", str(git_dir)]
+    return command
+
+
+def _parse_git_repo(potential_url):
+    """Uncached Git.parse_git_repo()."""
+    if not potential_url:
+        return None
+
+    # transform 4-6 to a URL-like string, so that we can handle it together with 1-3
+    if "@" in potential_url:
+        split = potential_url.split("@")
+        if len(split) == 2:
+            potential_url = "http://" + split[1]
+        else:
+            # more @s ?
+            return None
+
+    # make it parsable by urlparse if it doesn't contain scheme
+    if not potential_url.startswith(("http://", "https://", "git://", "git+https://")):
+        potential_url = "http://" + potential_url
+
+    # urlparse should handle it now
+    parsed = urlparse(potential_url)
+
+    username = None
+    if ":" in parsed.netloc:
+        # e.g. domain.com:foo or domain.com:1234, where foo is username, but 1234 is port number
+        split = parsed.netloc.split(":")
+        if split[1] and not split[1].isnumeric():
+            username = split[1]
+
+    # path starts with '/', strip it away
+    path = parsed.path.lstrip("/")
+
+    # strip trailing '.git'
+    if path.endswith(".git"):
+        path = path[: -len(".git")]
+
+    split = path.split("/")
+    if username and len(split) == 1:
+        # path contains only reponame, we got username earlier
+        return username, path
+    if not username and len(split) == 2:
+        # path contains username/reponame
+        return split[0], split[1]
+
+    # all other cases
+    return None
+
+
+# routing calls parse_git_repo() several times for URL of each event
+_cached_parse_git_repo = lru_cache(maxsize=PARSE_CACHE_SIZE)(_parse_git_repo)
+
 
 class Git(object):
     """Class for working with git."""
 
     @staticmethod
-    def call_git_cmd(cmd, return_output=True, msg=None, git_dir=None, shell=True):
+    @timed("git")
+    def call_git_cmd(
+        cmd, return_output=True, msg=None, git_dir=None, shell=None, env=None, cwd=None
+    ):
         """
         Runs the GIT command with specified arguments
         :param cmd: list or string, git subcommand for execution
         :param return_output: bool, return output of the command ?
         :param msg: log this before running the command
         :param git_dir: run the command in another directory
-        :param shell: bool, run git commands in shell by default
+        :param shell: bool, run git command in shell ?
+                      By default strings are run in shell and lists are executed directly
+                      (without spawning a shell, arguments with spaces are kept intact).
+        :param env: dict, environment variables to set (on top of the current ones)
+        :param cwd: directory to run the command in
         :return: output of the git command
         """
         if msg:
             logger.info(msg)
 
-        command = "git"
-        # use git_dir as work-tree git parameter and git-dir parameter (with added git.postfix)
-        if git_dir:
-            command += f" --git-dir {git_dir}/.git"
-            command += f" --work-tree {git_dir}"
         if isinstance(cmd, str):
-            command += f" {cmd}"
+            args = cmd
         elif isinstance(cmd, list):
-            command += f" {' '.join(cmd)}"
+            args = [str(arg) for arg in cmd]
         else:
             raise ValueError(f"{cmd} is not a list nor a string")
+        if shell is None:
+            shell = isinstance(args, str)
+
+        command = _git_command(git_dir)
+        if shell:
+            command = " ".join(quote(arg) for arg in command)
+            command += f" {args if isinstance(args, str) else ' '.join(args)}"
+        else:
+            command += split(args) if isinstance(args, str) else args
 
-        output = run_cmd(command, return_output=return_output, shell=shell)
+        if env:
+            env = {**os.environ, **env}
+        output = run_cmd(
+            command, return_output=return_output, shell=shell, env=env, cwd=cwd
+        )
         logger.debug(output)
         return output
 
@@ -71,51 +167,28 @@ class Git(object):
         Notably, the repo *must* have exactly username and reponame, nothing else and nothing
         more. E.g. `github.com/<username>/<reponame>/<something>` is *not* recognized.
         """
-        if not potential_url:
-            return None
+        return _cached_parse_git_repo(potential_url)
 
-        # transform 4-6 to a URL-like string, so that we can handle it together with 1-3
-        if "@" in potential_url:
-            split = potential_url.split("@")
-            if len(split) == 2:
-                potential_url = "http://" + split[1]
-            else:
-                # more @s ?
-                return None
-
-        # make it parsable by urlparse if it doesn't contain scheme
-        if not potential_url.startswith(
-            ("http://", "https://", "git://", "git+https://")
-        ):
-            potential_url = "http://" + potential_url
-
-        # urlparse should handle it now
-        parsed = urlparse(potential_url)
-
-        username = None
-        if ":" in parsed.netloc:
-            # e.g. domain.com:foo or domain.com:1234, where foo is username, but 1234 is port number
-            split = parsed.netloc.split(":")
-            if split[1] and not split[1].isnumeric():
-                username = split[1]
-
-        # path starts with '/', strip it away
-        path = parsed.path.lstrip("/")
-
-        # strip trailing '.git'
-        if path.endswith(".git"):
-            path = path[: -len(".git")]
-
-        split = path.split("/")
-        if username and len(split) == 1:
-            # path contains only reponame, we got username earlier
-            return username, path
-        if not username and len(split) == 2:
-            # path contains username/reponame
-            return split[0], split[1]
-
-        # all other cases
-        return None
+    @staticmethod
+    def parse_git_repos(urls):
+        """
+        Parse many URLs, e.g. of all repositories in an inventory, see parse_git_repo().
+
+        Each distinct URL is parsed once, the (bounded) cache of parse_git_repo()
+        is neither used nor filled.
+
+        :param urls: iterable of URLs
+        :return: list of (<username>, <reponame>) tuples or Nones, in the order of urls
+        """
+        parsed = {}
+        result = []
+        for url in urls:
+            try:
+                user_repo = parsed[url]
+            except KeyError:
+                user_repo = parsed[url] = _parse_git_repo(url)
+            result.append(user_repo)
+        return result
 
     @staticmethod
     def get_username_from_git_url(url):
@@ -149,3 +222,499 @@ class Git(object):
 \tfetch = +refs/pull/*/head:refs/remotes/origin/pr/*
 """
         (Path.home() / ".gitconfig").write_text(content)
+
+
+@contextmanager
+def _flock(path, shared=False, blocking=True):
+    """
+    Hold flock() of file at path, shared by other processes & threads or exclusive.
+
+    :return: bool, locked ? (always True when blocking)
+    """
+    with open(path, "a") as lock_file:
+        flags = fcntl.LOCK_SH if shared else fcntl.LOCK_EX
+        try:
+            fcntl.flock(lock_file, flags if blocking else flags | fcntl.LOCK_NB)
+        except BlockingIOError:
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def _disk_usage(path):
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.lstat(os.path.join(root, name)).st_size
+            except OSError:
+                pass
+    return total
+
+
+class GitMirrors(object):
+    """
+    Bare mirrors of remote repositories, shared by bots (and worker processes) on the node.
+
+    A mirror is cloned once and then only fetched, tasks get worktrees of it:
+
+        mirrors = GitMirrors()
+        with mirrors.worktree("https://github.com/user-cont/frambo", ref="master") as path:
+            ...
+
+    When mirrors take more than max_bytes of disk, the least recently used ones are removed.
+    Each {mirror}.git has {mirror}.lock (held while cloning/fetching/adding worktrees),
+    {mirror}.use (shared lock held while a worktree exists) and {mirror}.size
+    (disk usage, recomputed after each clone/fetch) next to it.
+    """
+
+    def __init__(self, cache_dir=None, max_bytes=None):
+        """
+        Initialize.
+
+        :param cache_dir: directory with mirrors, defaults to git:mirrors_dir from frambo config
+        :param max_bytes: disk budget, 0 means no limit,
+                          defaults to git:mirrors_max_bytes from frambo config
+        """
+        if cache_dir is None:
+            cache_dir = get_from_frambo_config("git", "mirrors_dir")
+        if max_bytes is None:
+            max_bytes = get_from_frambo_config(
+                "git", "mirrors_max_bytes", default=0, raises=False
+            )
+        self.cache_dir = Path(cache_dir)
+        self.max_bytes = max_bytes
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+
+    def path(self, url):
+        """Return path of mirror of url, e.g. {cache_dir}/frambo-1a2b3c4d5e6f7a8b.git"""
+        name = Git.get_reponame_from_git_url(url) or "repo"
+        return self.cache_dir / f"{name}-{sha256(url.encode()).hexdigest()[:16]}.git"
+
+    @staticmethod
+    def _lock(mirror):
+        return mirror.with_suffix(".lock")
+
+    @staticmethod
+    def _use(mirror):
+        return mirror.with_suffix(".use")
+
+    @staticmethod
+    def _size(mirror):
+        return mirror.with_suffix(".size")
+
+    def _update_size(self, mirror):
+        size = _disk_usage(mirror)
+        # evict() in other processes reads it without .lock
+        tmp = self._size(mirror).with_suffix(f".size.{os.getpid()}")
+        tmp.write_text(str(size))
+        tmp.replace(self._size(mirror))
+        return size
+
+    def size(self, mirror):
+        """Return disk usage of mirror, as of its last clone/fetch."""
+        try:
+            return int(self._size(mirror).read_text())
+        except (FileNotFoundError, ValueError):
+            return self._update_size(mirror)
+
+    def mirror(self, url, fetch=True):
+        """
+        Clone mirror of url or update it.
+
+        :param url: url of the repository
+        :param fetch: update mirror which already exists ?
+        :return: Path of the bare mirror
+        """
+        mirror = self.path(url)
+        with _flock(self._lock(mirror)):
+            if not mirror.is_dir():
+                logger.info(f"Creating mirror of {url}")
+                tmp = Path(mkdtemp(dir=self.cache_dir, suffix=".tmp"))
+                try:
+                    run_cmd(["git", "clone", "--mirror", "--quiet", url, str(tmp)])
+                    tmp.rename(mirror)
+                except Exception:
+                    rmtree(tmp, ignore_errors=True)
+                    raise
+            elif fetch:
+                logger.debug(f"Updating mirror of {url}")
+                run_cmd(
+                    ["git", "--git-dir", str(mirror), "fetch", "--prune", "--quiet"]
+                )
+            if fetch or not self._size(mirror).exists():
+                self._update_size(mirror)
+            # mtime of the lock file is when the mirror was used last time
+            os.utime(self._lock(mirror))
+        self.evict(keep=mirror)
+        return mirror
+
+    @contextmanager
+    def worktree(self, url, ref="HEAD", fetch=True):
+        """
+        Yield path of a temporary worktree of url's mirror, with ref checked out (detached).
+
+        :param url: url of the repository
+        :param ref: branch, tag or commit
+        :param fetch: update the mirror first ?
+        """
+        mirror = self.path(url)
+        # hold it from before mirror() releases .lock, so that evict() can't remove the mirror
+        with _flock(self._use(mirror), shared=True):
+            self.mirror(url, fetch=fetch)
+            dest = mkdtemp(prefix=f"{mirror.stem}-")
+            with _flock(self._lock(mirror)):
+                run_cmd(
+                    [
+                        "git",
+                        "--git-dir",
+                        str(mirror),
+                        "worktree",
+                        "add",
+                        "--detach",
+                        "--force",
+                        dest,
+                        ref,
+                    ],
+                    return_output=True,
+                )
+            try:
+                yield dest
+            finally:
+                rmtree(dest, ignore_errors=True)
+                with _flock(self._lock(mirror)):
+                    run_cmd(
+                        ["git", "--git-dir", str(mirror), "worktree", "prune"],
+                        ignore_error=True,
+                    )
+
+    def mirrors(self):
+        """Return mirrors, least recently used first."""
+
+        def last_used(mirror):
+            try:
+                return self._lock(mirror).stat().st_mtime
+            except FileNotFoundError:
+                return 0
+
+        return sorted(self.cache_dir.glob("*.git"), key=last_used)
+
+    def evict(self, keep=None):
+        """
+        Remove least recently used mirrors until they fit into max_bytes.
+        Mirrors which are being used are skipped.
+
+        :param keep: Path of mirror which shouldn't be removed
+        """
+        if not self.max_bytes:
+            return
+        usage = {mirror: self.size(mirror) for mirror in self.mirrors()}
+        total = sum(usage.values())
+        for mirror, size in usage.items():
+            if total <= self.max_bytes:
+                break
+            if mirror == keep:
+                continue
+            with _flock(self._lock(mirror), blocking=False) as locked:
+                if not locked:
+                    continue
+                with _flock(self._use(mirror), blocking=False) as unused:
+                    if not unused:
+                        continue
+                    logger.info(f"Removing mirror {mirror}")
+                    rmtree(mirror, ignore_errors=True)
+                    self._size(mirror).unlink(missing_ok=True)
+                    total -= size
+
+
+class CatFile(object):
+    """
+    Long-lived `git cat-file --batch` process reading objects of one repository.
+
+    Reading many files this way is much cheaper than running `git show` for each of them:
+
+        reader = cat_file(repo_dir)
+        dockerfile = reader.read("HEAD", "Dockerfile")
+
+    The process is (re)started on demand, e.g. after it died or a read failed.
+    Use cat_file() to share readers within a process.
+    """
+
+    def __init__(self, repo_dir):
+        """
+        Initialize.
+
+        :param repo_dir: work tree or bare repository (e.g. mirror from GitMirrors)
+        """
+        self.repo_dir = str(repo_dir)
+        self._process = None
+        self._lock = Lock()
+
+    def _start(self):
+        logger.debug(f"Starting git cat-file --batch in {self.repo_dir}")
+        self._process = subprocess.Popen(
+            ["git", "cat-file", "--batch"],
+            cwd=self.repo_dir,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+        )
+
+    def _read(self, spec, as_memoryview):
+        if self._process is not None and self._process.poll() is not None:
+            self._stop()
+        if self._process is None:
+            self._start()
+        stdin, stdout = self._process.stdin, self._process.stdout
+        stdin.write(spec.encode() + b"\n")
+        stdin.flush()
+
+        header = stdout.readline()
+        if not header.endswith(b"\n"):
+            raise BrokenPipeError(f"git cat-file exited, {self._process.poll()}")
+        fields = header.split()
+        if fields[-1] in (b"missing", b"ambiguous"):
+            raise KeyError(f"{spec} {fields[-1].decode()}")
+        size = int(fields[2])
+
+        if as_memoryview:
+            # read straight into the buffer which will be returned
+            content = memoryview(bytearray(size))
+            read = 0
+            while read < size:
+                n = stdout.readinto(content[read:])
+                if not n:
+                    break
+                read += n
+        else:
+            content = stdout.read(size)
+            read = len(content)
+        if read < size or stdout.read(1) != b"\n":
+            raise BrokenPipeError(f"Short read of {spec} from git cat-file")
+        return content
+
+    def read(self, rev, path=None, as_memoryview=False):
+        """
+        Read content of an object.
+
+        :param rev: revision (e.g. commit or branch) or any object name
+        :param path: path of file in rev, None to read rev itself
+        :param as_memoryview: return memoryview of a (writable) buffer instead of bytes
+        :return: bytes or memoryview
+        :raises KeyError: when there's no such object
+        """
+        spec = f"{rev}:{path}" if path is not None else str(rev)
+        if "\n" in spec:
+            raise ValueError(f"Invalid object name {spec!r}")
+        with self._lock:
+            try:
+                return self._read(spec, as_memoryview)
+            except (BrokenPipeError, ValueError, IndexError) as ex:
+                # the process is dead or the stream out of sync: start a new one, once
+                logger.warning(f"Restarting git cat-file in {self.repo_dir}: {ex!r}")
+                self._stop()
+                return self._read(spec, as_memoryview)
+
+    def _stop(self):
+        process, self._process = self._process, None
+        if process is None:
+            return
+        for pipe in (process.stdin, process.stdout):
+            try:
+                pipe.close()
+            except OSError:
+                pass
+        try:
+            process.wait(timeout=5)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            process.wait()
+
+    def close(self):
+        """Stop the git process."""
+        with self._lock:
+            self._stop()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+# number of CatFile readers (git processes) cat_file() keeps
+MAX_READERS = 16
+
+_readers = OrderedDict()
+_readers_pid = None
+_readers_lock = Lock()
+
+
+def cat_file(repo_dir):
+    """
+    Return CatFile of repo_dir shared by the whole process.
+
+    Pipes of processes started by parent can't be shared with forked processes,
+    so each (e.g. Celery worker) process gets its own readers.
+    Readers of removed directories (e.g. worktrees of finished tasks) and the least
+    recently used ones over MAX_READERS are closed.
+    """
+    global _readers, _readers_pid
+    key = os.path.abspath(repo_dir)
+    evicted = []
+    with _readers_lock:
+        if _readers_pid != os.getpid():
+            _readers = OrderedDict()
+            _readers_pid = os.getpid()
+        reader = _readers.get(key)
+        if reader is not None:
+            _readers.move_to_end(key)
+            return reader
+        for other in list(_readers):
+            if not os.path.isdir(other):
+                evicted.append(_readers.pop(other))
+        reader = _readers[key] = CatFile(key)
+        while len(_readers) > MAX_READERS:
+            evicted.append(_readers.popitem(last=False)[1])
+    for other in evicted:
+        other.close()
+    return reader
+
+
+@atexit.register
+def close_readers():
+    """Stop git processes of all readers."""
+    with _readers_lock:
+        readers = list(_readers.values()) if _readers_pid == os.getpid() else []
+        _readers.clear()
+    for reader in readers:
+        reader.close()
+
+
+class AsyncGit(object):
+    """
+    Run git commands concurrently in asyncio subprocesses, e.g. fetch hundreds of repos:
+
+        async def fetch_all(repos):
+            return await AsyncGit(concurrency=16).run_all(["fetch", "--prune"], repos)
+
+        results = asyncio.run(fetch_all(repos))
+
+    At most `concurrency` commands run at the same time, the others wait.
+    Cancelling a task running a command kills the git process.
+    """
+
+    def __init__(self, concurrency=8, timeout=None):
+        """
+        Initialize.
+
+        :param concurrency: maximal number of git processes running at once
+        :param timeout: default timeout of a command in seconds, None for no timeout
+        """
+        if concurrency < 1:
+            raise ValueError(f"concurrency must be positive, not {concurrency}")
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self._semaphore = None
+        self._loop = None
+
+    @staticmethod
+    async def _kill(process):
+        try:
+            # kill also helpers git started (e.g. ssh), which keep the output pipes open
+            os.killpg(process.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+        return await process.communicate()
+
+    async def run(
+        self, cmd, git_dir=None, env=None, cwd=None, timeout=None, check=False
+    ):
+        """
+        Run git command.
+
+        :param cmd: list or string, git subcommand for execution (never run in shell)
+        :param git_dir: run the command in another directory, as in Git.call_git_cmd()
+        :param env: dict, environment variables to set (on top of the current ones)
+        :param cwd: directory to run the command in
+        :param timeout: seconds after which the command is killed, defaults to self.timeout
+        :param check: raise subprocess.CalledProcessError when the command fails ?
+        :return: GitResult with decoded stdout & stderr and duration in seconds
+        """
+        if isinstance(cmd, str):
+            cmd = split(cmd)
+        elif isinstance(cmd, list):
+            cmd = [str(arg) for arg in cmd]
+        else:
+            raise ValueError(f"{cmd} is not a list nor a string")
+        args = _git_command(git_dir) + cmd
+        if env:
+            env = {**os.environ, **env}
+        if timeout is None:
+            timeout = self.timeout
+        # asyncio is expensive to import, frambo.git is imported by everyone
+        import asyncio
+
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            # semaphores can't be shared by event loops (e.g. of two asyncio.run() calls)
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+            self._loop = loop
+
+        async with self._semaphore:
+            logger.debug("command: %r", args)
+            with timed("git"):
+                start = monotonic()
+                process = await asyncio.create_subprocess_exec(
+                    *args,
+                    stdin=subprocess.DEVNULL,
+                    stdout=subprocess.PIPE,
+                    stderr=subprocess.PIPE,
+                    env=env,
+                    cwd=cwd,
+                    start_new_session=True,
+                )
+                try:
+                    stdout, stderr = await asyncio.wait_for(
+                        process.communicate(), timeout
+                    )
+                    rc = process.returncode
+                except asyncio.TimeoutError:
+                    logger.warning(f"{args} timed out after {timeout}s")
+                    stdout, stderr = await self._kill(process)
+                    rc = None
+                except asyncio.CancelledError:
+                    await asyncio.shield(self._kill(process))
+                    raise
+                duration = monotonic() - start
+
+        result = GitResult(
+            args,
+            rc,
+            stdout.decode(errors="replace"),
+            stderr.decode(errors="replace"),
+            duration,
+        )
+        if check and rc != 0:
+            raise subprocess.CalledProcessError(
+                process.returncode, args, result.stdout, result.stderr
+            )
+        return result
+
+    async def run_all(self, cmd, git_dirs, **kwargs):
+        """
+        Run the same git command in many repositories.
+
+        :param cmd: list or string, git subcommand for execution
+        :param git_dirs: iterable of repository directories
+        :param kwargs: passed to run()
+        :return: list of GitResult, in the order of git_dirs
+        """
+        import asyncio
+
+        return await asyncio.gather(
+            *(self.run(cmd, git_dir=git_dir, **kwargs) for git_dir in git_dirs)
+        )
@@ -0,0 +1,146 @@
+# -*- coding: utf-8 -*-
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+from logging import getLogger
+from os import getpid
+from threading import Lock
+
+from requests import Session
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from frambo.config import get_from_frambo_config, settings
+
+logger = getLogger(__name__)
+
+# status codes worth retrying, the rest is up to the caller
+RETRY_STATUSES = (500, 502, 503, 504)
+
+
+class TimeoutHTTPAdapter(HTTPAdapter):
+    """HTTPAdapter which applies default timeout to requests which don't set one."""
+
+    def __init__(self, *args, timeout=None, **kwargs):
+        """
+        Initialize.
+
+        :param timeout: float or (connect, read) tuple, see requests' timeout argument
+        """
+        self.timeout = timeout
+        super().__init__(*args, **kwargs)
+
+    def send(self, request, **kwargs):
+        if kwargs.get("timeout") is None:
+            kwargs["timeout"] = self.timeout
+        return super().send(request, **kwargs)
+
+
+def create_session(
+    connect_timeout=5,
+    read_timeout=30,
+    retries=3,
+    backoff_factor=0.5,
+    pool_connections=10,
+    pool_maxsize=10,
+    hosts=None,
+):
+    """
+    Create requests.Session with keep-alive connection pools, timeouts and retries.
+
+    :param connect_timeout: seconds to wait for connection to be established
+    :param read_timeout: seconds to wait for server's response
+    :param retries: how many times to retry failed (idempotent) requests
+    :param backoff_factor: sleep backoff_factor * 2^(retry - 1) seconds between retries
+    :param pool_connections: number of per-host connection pools to keep
+    :param pool_maxsize: max number of connections kept in each pool
+    :param hosts: dict, host: pool_maxsize for hosts which need different pool size
+    :return: requests.Session
+    """
+    retry = Retry(
+        total=retries,
+        backoff_factor=backoff_factor,
+        status_forcelist=RETRY_STATUSES,
+        # let the caller see the last response instead of raising
+        raise_on_status=False,
+    )
+
+    def adapter(maxsize):
+        return TimeoutHTTPAdapter(
+            timeout=(connect_timeout, read_timeout),
+            max_retries=retry,
+            pool_connections=pool_connections,
+            pool_maxsize=maxsize,
+        )
+
+    session = Session()
+    session.mount("https://", adapter(pool_maxsize))
+    session.mount("http://", adapter(pool_maxsize))
+    for host, maxsize in (hosts or {}).items():
+        session.mount(f"https://{host}/", adapter(maxsize))
+        session.mount(f"http://{host}/", adapter(maxsize))
+    return session
+
+
+def session_options():
+    """Return create_session() keyword arguments as set in 'http' section of frambo config."""
+    options = {}
+    for key in (
+        "connect_timeout",
+        "read_timeout",
+        "retries",
+        "backoff_factor",
+        "pool_connections",
+        "pool_maxsize",
+        "hosts",
+    ):
+        value = get_from_frambo_config("http", key, default=None, raises=False)
+        if value is not None:
+            options[key] = value
+    return options
+
+
+_session = None
+_session_pid = None
+_session_options = None
+_session_lock = Lock()
+
+
+def get_session():
+    """
+    Return requests.Session shared by the whole process.
+
+    Connection pools can't be shared with forked processes,
+    so each (e.g. Celery worker) process gets its own session.
+    """
+    global _session, _session_pid, _session_options
+    if _session_pid == getpid():
+        return _session
+    with _session_lock:
+        if _session_pid != getpid():
+            logger.debug("Creating HTTP session")
+            _session_options = session_options()
+            _session = create_session(**_session_options)
+            _session_pid = getpid()
+    return _session
+
+
+@settings.on_reload
+def _drop_changed_session():
+    """Create new session on next get_session() if 'http' settings have changed."""
+    global _session_pid
+    with _session_lock:
+        if _session_pid is not None and _session_options != session_options():
+            logger.info("HTTP settings have changed")
+            _session_pid = None
@@ -0,0 +1,514 @@
+# -*- coding: utf-8 -*-
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+from atexit import register as atexit_register
+from collections import Counter
+import fcntl
+from glob import escape as glob_escape, glob
+import gzip
+import logging
+from logging.handlers import QueueHandler
+from os import fstat, getpid, path, remove, rename, replace, stat
+from queue import Empty, Full, Queue
+from shutil import copyfileobj
+from threading import Lock, Thread
+from time import gmtime, strftime
+from weakref import WeakSet
+
+from celery.signals import task_postrun, worker_process_shutdown, worker_shutdown
+
+from frambo.config import get_from_frambo_config
+
+logger = logging.getLogger(__name__)
+
+# what to do with a record when the queue is full
+BLOCK = "block"  # wait for the writer thread
+DROP_NEW = "drop-new"  # throw the record away
+DROP_OLD = "drop-old"  # throw the oldest queued record away
+OVERFLOW_POLICIES = (BLOCK, DROP_NEW, DROP_OLD)
+
+# tells the writer thread to finish
+_STOP = object()
+
+_writers = WeakSet()
+_writers_lock = Lock()
+
+
+class BatchFileHandler(logging.FileHandler):
+    """FileHandler which can write several records at once, with a single flush."""
+
+    def emit_batch(self, records):
+        """
+        Write records.
+
+        :param records: list of logging.LogRecord
+        """
+        self.acquire()
+        try:
+            self.write(self.format_batch(records), records)
+        finally:
+            self.release()
+
+    def format_batch(self, records):
+        chunks = []
+        for record in records:
+            try:
+                chunks.append(self.format(record) + self.terminator)
+            except Exception:
+                self.handleError(record)
+        return chunks
+
+    def write(self, chunks, records):
+        if not chunks:
+            return
+        try:
+            if self.stream is None:
+                self.stream = self._open()
+            self.stream.write("".join(chunks))
+            self.flush()
+        except Exception:
+            self.handleError(records[-1])
+
+
+class DailyFileHandler(BatchFileHandler):
+    """
+    Write to {base_path}-{date} file, switching to a new one at midnight (UTC).
+
+    The file is also rotated to {base_path}-{date}.{n} when it would grow over max_bytes.
+    Rotated files are gzipped in a background thread and only backup_count newest ones are kept.
+
+    Several processes (e.g. prefork Celery workers) can write the same file:
+    a handler reopens the file when another one rotated it, rotations are serialized
+    by flock() of {base_path}.lock and writers hold a shared flock() of the file they
+    write to, so that it isn't compressed (and removed) under their hands.
+    """
+
+    def __init__(self, base_path, max_bytes=0, backup_count=30, compress=True):
+        """
+        Initialize.
+
+        :param base_path: log file path without the date suffix
+        :param max_bytes: rotate the file when it's (roughly) this big, 0 means never
+        :param backup_count: number of rotated files to keep, 0 means all
+        :param compress: gzip rotated files
+        """
+        self.base_path = path.abspath(base_path)
+        self.lock_path = f"{self.base_path}.lock"
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self.compress = compress
+        self.date = strftime("%Y%m%d", gmtime())
+        self.housekeeping = None
+        super().__init__(self.dated_path(self.date), delay=True)
+
+    def dated_path(self, date):
+        return f"{self.base_path}-{date}"
+
+    def emit(self, record):
+        self.emit_batch([record])
+
+    def emit_batch(self, records):
+        self.acquire()
+        try:
+            batch = []
+            for record in records:
+                date = strftime("%Y%m%d", gmtime(record.created))
+                if date > self.date:
+                    self.write(self.format_batch(batch), batch)
+                    batch = []
+                    self.rollover(date=date)
+                batch.append(record)
+            self.write(self.format_batch(batch), batch)
+        finally:
+            self.release()
+
+    def moved(self):
+        """Has the open file been rotated (or removed) by another handler ?"""
+        if self.stream is None:
+            return False
+        try:
+            current = stat(self.baseFilename)
+        except FileNotFoundError:
+            return True
+        opened = fstat(self.stream.fileno())
+        return (opened.st_dev, opened.st_ino) != (current.st_dev, current.st_ino)
+
+    def close_stream(self):
+        if self.stream is not None:
+            self.stream.close()
+            self.stream = None
+
+    def write(self, chunks, records):
+        if not chunks:
+            return
+        try:
+            if self.moved():
+                self.close_stream()
+            if self.max_bytes:
+                length = sum(len(chunk) for chunk in chunks)
+                size = self.size()
+                if size and size + length > self.max_bytes:
+                    with open(self.lock_path, "a") as lock_file:
+                        fcntl.flock(lock_file, fcntl.LOCK_EX)
+                        # another process might have rotated it in the meantime
+                        if self.moved():
+                            self.close_stream()
+                        size = self.size()
+                        if size and size + length > self.max_bytes:
+                            self.rollover()
+            while True:
+                if self.stream is None:
+                    self.stream = self._open()
+                fcntl.flock(self.stream, fcntl.LOCK_SH)
+                if not self.moved():
+                    break
+                # compressed (and removed) before we got the lock
+                self.close_stream()
+        except Exception:
+            self.handleError(records[-1])
+            return
+        try:
+            super().write(chunks, records)
+        finally:
+            if self.stream is not None:
+                fcntl.flock(self.stream, fcntl.LOCK_UN)
+
+    def size(self):
+        # not stream.tell(), other processes append to the file too
+        try:
+            if self.stream is not None:
+                return fstat(self.stream.fileno()).st_size
+            return stat(self.baseFilename).st_size
+        except FileNotFoundError:
+            return 0
+
+    def rollover(self, date=None):
+        """
+        Switch to file for date, or (without date) rotate the current one.
+
+        :param date: str, YYYYMMDD
+        """
+        self.close_stream()
+        if date:
+            self.date = date
+            self.baseFilename = self.dated_path(date)
+        else:
+            # the newest rotated file has the highest n, even when older ones are gone
+            rotated = glob(f"{glob_escape(self.baseFilename)}.*")
+            numbers = (
+                file[len(self.baseFilename) + 1 :].split(".")[0] for file in rotated
+            )
+            n = 1 + max(
+                (int(number) for number in numbers if number.isdigit()),
+                default=0,
+            )
+            try:
+                rename(self.baseFilename, f"{self.baseFilename}.{n}")
+            except OSError as exc:
+                # e.g. already rotated by another process
+                logger.debug(f"Failed to rotate {self.baseFilename}: {exc}")
+        self.housekeeping = Thread(
+            target=self.clean_up, name=f"log-housekeeping-{self.base_path}", daemon=True
+        )
+        self.housekeeping.start()
+
+    def rotated_files(self):
+        """Return rotated files, oldest first."""
+
+        def age(file):
+            # {date}[.{n}][.gz], file without n is the last one of its day
+            date, _, n = (
+                file[len(self.base_path) + 1 :].replace(".gz", "").partition(".")
+            )
+            return date, int(n) if n.isdigit() else float("inf")
+
+        def rotated(file):
+            date, n = age(file)
+            # other processes may have switched to a newer file already
+            return n != float("inf") or date < self.date or file.endswith(".gz")
+
+        files = [
+            file
+            for file in glob(f"{glob_escape(self.base_path)}-*")
+            if not file.endswith(".tmp") and rotated(file)
+        ]
+        return sorted(files, key=age)
+
+    def clean_up(self):
+        """Compress rotated files and remove the old ones."""
+        files = self.rotated_files()
+        if self.backup_count:
+            for file in files[: -self.backup_count]:
+                remove_quietly(file)
+            files = files[-self.backup_count :]
+        if self.compress:
+            for file in files:
+                if not file.endswith(".gz"):
+                    compress(file)
+
+
+def compress(file):
+    """
+    Replace file with its gzipped copy, file.gz, or append it to file.gz when that exists
+    (e.g. records written to yesterday's file by another process after it was compressed).
+
+    Waits for writers (which hold a shared flock()) to finish.
+    """
+    tmp = f"{file}.gz.{getpid()}.tmp"
+    try:
+        with open(file, "rb") as f_in:
+            fcntl.flock(f_in, fcntl.LOCK_EX)
+            if fstat(f_in.fileno()).st_ino != stat(file).st_ino:
+                # compressed by another process in the meantime
+                return
+            with open(tmp, "wb") as f_out:
+                try:
+                    with open(f"{file}.gz", "rb") as previous:
+                        # gzip files can be concatenated
+                        copyfileobj(previous, f_out)
+                except FileNotFoundError:
+                    pass
+                with gzip.open(f_out, "wb") as gz_out:
+                    copyfileobj(f_in, gz_out)
+            replace(tmp, f"{file}.gz")
+            remove(file)
+    except OSError as exc:
+        # e.g. compressed by another process in the meantime
+        logger.debug(f"Failed to compress {file}: {exc}")
+        remove_quietly(tmp)
+
+
+def remove_quietly(file):
+    try:
+        remove(file)
+    except OSError:
+        pass
+
+
+class BackgroundHandler(QueueHandler):
+    """
+    Handler passing records to a writer thread, which hands them to the target handler.
+
+    Logging a record just puts it into a bounded queue, formatting and writing
+    happens in the writer thread, in batches if target has emit_batch().
+    """
+
+    def __init__(self, target, queue_size=10000, overflow=BLOCK, batch_size=100):
+        """
+        Initialize.
+
+        :param target: logging.Handler which does the real work
+        :param queue_size: max number of records waiting for the writer thread
+        :param overflow: BLOCK, DROP_NEW or DROP_OLD, what to do when the queue is full
+        :param batch_size: max number of records written at once
+        """
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError(f"Unknown overflow policy {overflow!r}")
+        if queue_size < 1 or batch_size < 1:
+            raise ValueError("queue_size and batch_size must be positive")
+        super().__init__(Queue(maxsize=queue_size))
+        self.target = target
+        self.overflow = overflow
+        self.batch_size = batch_size
+        self.stats = Counter()
+        self._thread = None
+        self._pid = None
+        self._start_lock = Lock()
+        with _writers_lock:
+            _writers.add(self)
+
+    def _start(self):
+        with self._start_lock:
+            if self._running():
+                return
+            if self._pid not in (None, getpid()):
+                # forked, the writer thread stayed in the parent process
+                # and so did the responsibility for records queued there
+                self.queue = Queue(maxsize=self.queue.maxsize)
+            self._thread = Thread(
+                target=self._run, name=f"log-writer-{self.target}", daemon=True
+            )
+            self._thread.start()
+            self._pid = getpid()
+
+    def _run(self):
+        queue = self.queue
+        stop = False
+        while not stop:
+            batch = [queue.get()]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(queue.get_nowait())
+                except Empty:
+                    break
+            records = []
+            for item in batch:
+                if item is _STOP:
+                    stop = True
+                elif item.levelno >= self.target.level:
+                    records.append(item)
+            self._write(records)
+            for _ in batch:
+                queue.task_done()
+
+    def _write(self, records):
+        # whatever happens, the thread must go on, or the callers block on full queue
+        if hasattr(self.target, "emit_batch"):
+            try:
+                records = [record for record in records if self.target.filter(record)]
+                if records:
+                    self.target.emit_batch(records)
+                    self.stats["written"] += len(records)
+            except Exception:
+                self.stats["failed"] += len(records)
+                self.handleError(records[-1])
+            return
+        for record in records:
+            try:
+                self.target.handle(record)
+                self.stats["written"] += 1
+            except Exception:
+                self.stats["failed"] += 1
+                self.handleError(record)
+
+    def prepare(self, record):
+        # Unlike QueueHandler, don't format the record here,
+        # moving that out of the logging thread is the point.
+        return record
+
+    def enqueue(self, record):
+        if not self._running():
+            self._start()
+        if self.overflow == BLOCK:
+            self.queue.put(record)
+            return
+        while True:
+            try:
+                self.queue.put_nowait(record)
+                return
+            except Full:
+                if self.overflow == DROP_NEW:
+                    self.stats["dropped"] += 1
+                    return
+            try:
+                oldest = self.queue.get_nowait()
+            except Empty:
+                continue
+            self.queue.task_done()
+            if oldest is _STOP:
+                # stop() is waiting for it, queue it after the record
+                self.queue.put(record)
+                self.queue.put(_STOP)
+                return
+            self.stats["dropped"] += 1
+
+    def _running(self):
+        return (
+            self._pid == getpid()
+            and self._thread is not None
+            and self._thread.is_alive()
+        )
+
+    def flush(self):
+        """Wait until all queued records are written."""
+        if self._running():
+            self.queue.join()
+        self.target.flush()
+
+    def stop(self):
+        """Write queued records and stop the writer thread, logging restarts it."""
+        with self._start_lock:
+            if self._running():
+                self.queue.put(_STOP)
+                self._thread.join()
+            self._pid = None
+
+    def close(self):
+        self.stop()
+        self.target.close()
+        super().close()
+
+
+def writer_options():
+    """Return BackgroundHandler() keyword arguments as set in 'logger' section of frambo config."""
+    options = {}
+    for key in ("queue_size", "overflow", "batch_size"):
+        value = get_from_frambo_config("logger", key, default=None, raises=False)
+        if value is not None:
+            options[key] = value
+    return options
+
+
+_file_handlers = {}
+_file_handlers_lock = Lock()
+
+
+def rotation_options():
+    """Return DailyFileHandler() keyword arguments as set in 'logger' section of frambo config."""
+    options = {}
+    for key in ("max_bytes", "backup_count", "compress"):
+        value = get_from_frambo_config("logger", key, default=None, raises=False)
+        if value is not None:
+            options[key] = value
+    return options
+
+
+def file_handler(file_path, background=True, rotating=False):
+    """
+    Return handler writing to file_path, the same one each time it's asked for.
+
+    Handlers (and writer threads) aren't created per Logger instance,
+    so that they don't pile up in long running workers.
+
+    :param file_path: log file, without the date suffix if rotating
+    :param background: write in a background thread
+    :param rotating: use DailyFileHandler
+    :return: BackgroundHandler, DailyFileHandler or BatchFileHandler
+    """
+    key = (path.abspath(file_path), background, rotating)
+    with _file_handlers_lock:
+        handler = _file_handlers.get(key)
+        if handler is None:
+            if rotating:
+                handler = DailyFileHandler(file_path, **rotation_options())
+            else:
+                handler = BatchFileHandler(file_path)
+            if background:
+                handler = BackgroundHandler(handler, **writer_options())
+            _file_handlers[key] = handler
+    return handler
+
+
+def flush_writers(**kwargs):
+    """Wait until all BackgroundHandlers write their queued records."""
+    with _writers_lock:
+        writers = list(_writers)
+    for writer in writers:
+        writer.flush()
+
+
+def stop_writers(**kwargs):
+    """Write queued records and stop writer threads of all BackgroundHandlers."""
+    with _writers_lock:
+        writers = list(_writers)
+    for writer in writers:
+        writer.stop()
+
+
+# records logged by a task are on disk once it ends
+task_postrun.connect(flush_writers, weak=False)
+worker_process_shutdown.connect(stop_writers, weak=False)
+worker_shutdown.connect(stop_writers, weak=False)
+atexit_register(stop_writers)
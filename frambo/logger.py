@@ -18,6 +18,33 @@ from datetime import datetime
 import json
 import logging
 import os
+from threading import RLock
+
+try:
+    # optional, faster JSON encoder
+    import orjson
+except ImportError:
+    orjson = None
+
+from frambo.config import get_from_frambo_config, settings
+from frambo.log_writer import file_handler
+
+LEVELS = {logging.CRITICAL, logging.ERROR, logging.WARNING, logging.INFO, logging.DEBUG}
+
+# multi-line JSON with sorted keys, for humans
+PRETTY = "pretty"
+# one compact JSON object per line, for machines
+NDJSON = "ndjson"
+
+
+@settings.register("LOG_FORMAT")
+def _log_format():
+    return get_from_frambo_config("logger", "format", default=PRETTY, raises=False)
+
+
+@settings.register("LOG_BACKGROUND")
+def _log_background():
+    return get_from_frambo_config("logger", "background", default=True, raises=False)
 
 
 class Logger(object):
@@ -34,6 +61,8 @@ class Logger(object):
         to_file=True,
         file_path=None,
         additional=None,
+        log_format=None,
+        background=None,
     ):
         """
         Initialize.
@@ -43,19 +72,27 @@ class Logger(object):
         :param to_file: log to file ?
         :param file_path: which file to log to, defaults to /var/log/bots/{task}.log-{date}
         :param additional: additional string to include in log file name
+        :param log_format: PRETTY or NDJSON, defaults to logger:format from frambo config
+        :param background: write to file in a background thread (see frambo/log_writer.py),
+                           defaults to logger:background from frambo config
         """
         self.task_name = task_name
+        self.log_format = log_format or settings.LOG_FORMAT
+        if self.log_format not in (PRETTY, NDJSON):
+            raise ValueError(f"Unknown log format {self.log_format!r}")
         self.logger = (
             get_task_logger(task_name) if task_name else logging.getLogger(__name__)
         )
         self.logger.setLevel(level)
-        self.log_file = None
+        self._file_handler = None
 
         if not task_name:
             # add stderr handler only if there's no task_name since Celery workers already have one
-            self.logger.addHandler(logging.StreamHandler())
+            # addHandler() ignores handler which the logger already has
+            self.logger.addHandler(_stderr_handler())
 
         if to_file:
+            rotating = False
             if file_path:
                 if additional:
                     raise ValueError("file_path and additional can't be both defined")
@@ -66,36 +103,43 @@ class Logger(object):
                     return
             else:  # file_path not specified, will log to default location
                 try:
-                    file_path = self.file_path(additional=additional)
+                    file_path = self.file_path(additional=additional, date=False)
                 except RuntimeError as exc:
                     # default log dir doesn't exist
                     self.logger.error(exc)
                     return
-            self.log_file = file_path
-            file_handler = logging.FileHandler(file_path)
-            self.logger.addHandler(file_handler)
+                # the date is appended by the handler, which switches files at midnight
+                rotating = True
+            if background is None:
+                background = settings.LOG_BACKGROUND
+            self._file_handler = file_handler(
+                file_path, background=background, rotating=rotating
+            )
+            self.logger.addHandler(self._file_handler)
+
+    @property
+    def log_file(self):
+        """Path to file which is logged to, None if not logging to file."""
+        handler = getattr(self._file_handler, "target", self._file_handler)
+        return handler.baseFilename if handler else None
 
     def file_path(self, additional=None, date=True):
         """
         Return path to file where logs will be saved.
 
         :param additional: additional string to include in log file name
-        :param date: include date (YMD) in log file name
+        :param date: include (today's, UTC) date (YMD) in log file name
         :returns if both additional and date then /var/log/bots/{task}-{additional}.log-{date}
         """
         logs_dir = os.getenv("LOGS_DIR") or "/var/log/bots"
         if not os.path.isdir(logs_dir):
             raise RuntimeError("{} is not a directory".format(logs_dir))
 
-        return (
-            "{dir}/{task}{additional}.log{date}".format(
-                dir=logs_dir,
-                task=self.task_name,
-                additional="-" + additional if additional else "",
-                date="-" + datetime.now().strftime("%Y%m%d"),
-            )
-            if date
-            else ""
+        return "{dir}/{task}{additional}.log{date}".format(
+            dir=logs_dir,
+            task=self.task_name,
+            additional="-" + additional if additional else "",
+            date="-" + datetime.utcnow().strftime("%Y%m%d") if date else "",
         )
 
     @staticmethod
@@ -109,32 +153,31 @@ class Logger(object):
             msg = msg.decode("utf-8")
         return msg % args if args else msg
 
+    def is_enabled_for(self, level):
+        """Would a message of this level be logged ?"""
+        return self.logger.isEnabledFor(level)
+
     def log(self, level, report_dict):
         """
         Logging workhorse.
 
+        The report_dict is serialized only if (and when) it's really emitted,
+        messages below logger's level cost close to nothing.
+
         :param level: logging level as defined in logging module
         :param report_dict: dictionary to be logged, mandatory keys: 'message'
         """
-        msg = self.serialize(level, report_dict)
-        if level == logging.CRITICAL:
-            self.logger.critical(msg)
-        elif level == logging.ERROR:
-            self.logger.error(msg)
-        elif level == logging.WARNING:
-            self.logger.warning(msg)
-        elif level == logging.INFO:
-            self.logger.info(msg)
-        elif level == logging.DEBUG:
-            self.logger.debug(msg)
+        if level not in LEVELS or not self.logger.isEnabledFor(level):
+            return
+        self.logger.log(level, LazyReport(self, self.fill(level, report_dict)))
 
-    def serialize(self, level, report_dict):
+    def fill(self, level, report_dict):
         """
-        Fill in additional info to report_dict and serialize it.
+        Fill in additional info to report_dict.
 
         :param level: logging level as defined in logging module
         :param report_dict: dictionary to be logged
-        :return:
+        :return: report_dict
         """
         report_dict.update(
             {
@@ -143,7 +186,127 @@ class Logger(object):
                 "time": str(datetime.utcnow()),
             }
         )
+        return report_dict
+
+    def serialize(self, level, report_dict):
+        """
+        Fill in additional info to report_dict and serialize it.
+
+        :param level: logging level as defined in logging module
+        :param report_dict: dictionary to be logged
+        :return:
+        """
+        return self.dumps(self.fill(level, report_dict))
+
+    def dumps(self, report_dict):
+        """
+        Serialize report_dict according to log_format.
+
+        :param report_dict: dictionary to be logged
+        :return: str
+        """
+        if self.log_format == NDJSON:
+            return compact_dumps(report_dict)
         serialized = json.dumps(report_dict, sort_keys=True, indent=2)
         # HACK: Pretty print newlines in values - strings. Feel free to fix it if you know better.
         serialized = serialized.replace("\\n", "\n")
         return serialized
+
+
+def compact_dumps(report_dict):
+    """
+    Serialize report_dict into one line of JSON, using orjson if it's installed.
+    Values which aren't JSON serializable are converted to str.
+
+    :param report_dict: dictionary to be logged
+    :return: str
+    """
+    if orjson:
+        try:
+            return orjson.dumps(
+                report_dict, default=str, option=orjson.OPT_NON_STR_KEYS
+            ).decode()
+        except TypeError:
+            # e.g. keys orjson can't serialize, json is more forgiving
+            pass
+    return json.dumps(
+        report_dict, separators=(",", ":"), ensure_ascii=False, default=str
+    )
+
+
+_stderr = None
+_loggers = {}
+_loggers_lock = RLock()
+
+
+def _stderr_handler():
+    global _stderr
+    with _loggers_lock:
+        if _stderr is None:
+            _stderr = logging.StreamHandler()
+    return _stderr
+
+
+def get_logger(
+    task_name=None,
+    level=logging.NOTSET,
+    to_file=True,
+    file_path=None,
+    additional=None,
+    log_format=None,
+    background=None,
+):
+    """
+    Return Logger, the same one for the same arguments (except level) in the whole process.
+
+    Creating Logger for each Bot instance would (in a long running worker) slowly
+    pile up handlers of the shared logging.Logger, so use this instead.
+    See Logger for description of the arguments.
+
+    :return: Logger
+    """
+    key = (task_name, to_file, file_path, additional, log_format, background)
+    log = _loggers.get(key)
+    if log is None:
+        with _loggers_lock:
+            log = _loggers.get(key)
+            if log is None:
+                log = Logger(
+                    task_name,
+                    level=level,
+                    to_file=to_file,
+                    file_path=file_path,
+                    additional=additional,
+                    log_format=log_format,
+                    background=background,
+                )
+                _loggers[key] = log
+                return log
+    if log.logger.level != level:
+        log.logger.setLevel(level)
+    return log
+
+
+class LazyReport(object):
+    """Log message serializing report_dict when it's formatted by a handler."""
+
+    __slots__ = ("logger", "report_dict", "serialized")
+
+    def __init__(self, logger, report_dict):
+        """
+        Initialize.
+
+        :param logger: Logger
+        :param report_dict: dictionary to be logged
+        """
+        self.logger = logger
+        # it's serialized later (possibly in another thread),
+        # when the caller might have already changed the dict
+        self.report_dict = dict(report_dict)
+        self.serialized = None
+
+    def __str__(self):
+        # each handler formats the record again
+        if self.serialized is None:
+            self.serialized = self.logger.dumps(self.report_dict)
+        return self.serialized
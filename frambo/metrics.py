@@ -0,0 +1,278 @@
+# -*- coding: utf-8 -*-
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Timing histograms & counters of bot task phases, exported in Prometheus text format.
+
+    with timed("clone"):
+        ...
+
+    @timed("config_fetch")
+    def fetch_configuration(url):
+        ...
+"""
+
+from bisect import bisect_left
+from contextlib import contextmanager
+from logging import getLogger
+import os
+import sys
+from threading import Lock, Thread
+from time import monotonic, perf_counter
+
+logger = getLogger(__name__)
+
+# seconds, like prometheus_client's defaults, but longer since tasks run for minutes
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300)
+
+PHASE_DURATION = "frambo_phase_duration_seconds"
+PHASE_ERRORS = "frambo_phase_errors_total"
+
+
+class Histogram(object):
+    """Counts of observed values in buckets, their sum and count."""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        # the last one is +Inf
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Registry(object):
+    """Thread-safe collection of histograms and counters, identified by name & labels."""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        """
+        Initialize.
+
+        :param buckets: upper bounds of histogram buckets
+        """
+        self.buckets = buckets
+        self._histograms = {}
+        self._counters = {}
+        self._help = {}
+        self._lock = Lock()
+
+    def describe(self, name, text):
+        """Set HELP text of a metric."""
+        self._help[name] = text
+
+    def observe(self, name, value, **labels):
+        """Add value to histogram."""
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram(self.buckets)
+            histogram.observe(value)
+
+    def inc(self, name, value=1, **labels):
+        """Increment counter."""
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def get(self, name, **labels):
+        """Return value of counter or Histogram, None if there's no such metric."""
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            return self._counters.get(key, self._histograms.get(key))
+
+    def clear(self):
+        with self._lock:
+            self._histograms.clear()
+            self._counters.clear()
+
+    def render(self):
+        """Return all metrics in Prometheus text exposition format."""
+        lines = []
+        with self._lock:
+            histograms = sorted(self._histograms.items())
+            counters = sorted(self._counters.items())
+        described = set()
+
+        def header(name, kind):
+            if name not in described:
+                described.add(name)
+                if name in self._help:
+                    lines.append(f"# HELP {name} {self._help[name]}")
+                lines.append(f"# TYPE {name} {kind}")
+
+        for (name, labels), histogram in histograms:
+            header(name, "histogram")
+            cumulative = 0
+            bounds = [str(bound) for bound in histogram.buckets] + ["+Inf"]
+            for bound, count in zip(bounds, histogram.counts):
+                cumulative += count
+                lines.append(
+                    f"{name}_bucket{_labels(labels + (('le', bound),))} {cumulative}"
+                )
+            lines.append(f"{name}_sum{_labels(labels)} {histogram.sum}")
+            lines.append(f"{name}_count{_labels(labels)} {histogram.count}")
+        for (name, labels), value in counters:
+            header(name, "counter")
+            lines.append(f"{name}{_labels(labels)} {value}")
+        return "\n".join(lines) + "\n"
+
+    def write(self, path):
+        """Write metrics to file at path, atomically (for node_exporter's textfile collector)."""
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "w") as f:
+            f.write(self.render())
+        os.replace(tmp, path)
+
+
+def _labels(labels):
+    if not labels:
+        return ""
+    escaped = (
+        (key, str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"'))
+        for key, value in labels
+    )
+    return "{" + ",".join(f'{key}="{value}"' for key, value in escaped) + "}"
+
+
+registry = Registry()
+registry.describe(PHASE_DURATION, "Duration of bot task phases.")
+registry.describe(PHASE_ERRORS, "Number of bot task phases which raised an exception.")
+
+
+def current_task_name():
+    """Return name of Celery task being executed, empty string outside of tasks."""
+    # no need to import celery, there's no task if nobody else has done it
+    celery = sys.modules.get("celery")
+    task = celery.current_task if celery else None
+    return task.name if task else ""
+
+
+@contextmanager
+def timed(phase, task=None):
+    """
+    Measure duration of the block (or of each call of decorated function).
+
+    :param phase: str, e.g. 'config_fetch'
+    :param task: str, task name, defaults to the current Celery task
+    """
+    labels = {"phase": phase, "task": task or current_task_name()}
+    start = perf_counter()
+    try:
+        yield
+    except Exception:
+        registry.inc(PHASE_ERRORS, **labels)
+        raise
+    finally:
+        registry.observe(PHASE_DURATION, perf_counter() - start, **labels)
+
+
+def serve(port, address="127.0.0.1", attempts=1):
+    """
+    Serve metrics over HTTP in a background thread.
+
+    Celery worker processes can't share a port, so with attempts > 1
+    the first free one of port, port + 1, ... is used.
+
+    :param port: int, 0 means any free port
+    :param address: address to listen on
+    :param attempts: number of ports to try
+    :return: ThreadingHTTPServer, see its server_port
+    """
+    # http.server is imported by serve() only, frambo.metrics is imported everywhere
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            body = registry.render().encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    for offset in range(attempts):
+        try:
+            server = ThreadingHTTPServer((address, port + offset), MetricsHandler)
+            break
+        except OSError:
+            if offset + 1 == attempts:
+                raise
+    Thread(target=server.serve_forever, name="metrics-server", daemon=True).start()
+    logger.info(f"Serving metrics on http://{address}:{server.server_port}/")
+    return server
+
+
+def exporter_options():
+    """Return 'metrics' section of frambo config."""
+    from frambo.config import get_from_frambo_config
+
+    return {
+        key: get_from_frambo_config("metrics", key, default=default, raises=False)
+        for key, default in (
+            ("file", None),
+            ("write_interval", 10),
+            ("port", None),
+            ("port_attempts", 32),
+        )
+    }
+
+
+_last_write = None
+
+
+def _write_file(**kwargs):
+    """Write metrics file (if configured) after a task, at most once per write_interval."""
+    global _last_write
+    options = exporter_options()
+    if not options["file"]:
+        return
+    if (
+        _last_write is not None
+        and monotonic() - _last_write < options["write_interval"]
+    ):
+        return
+    _last_write = monotonic()
+    path = options["file"].format(pid=os.getpid())
+    try:
+        registry.write(path)
+    except OSError as exc:
+        logger.warning(f"Failed to write metrics to {path}: {exc}")
+
+
+def _serve(**kwargs):
+    """Start metrics server (if configured) in each worker process."""
+    options = exporter_options()
+    if options["port"] is None:
+        return
+    try:
+        serve(options["port"], attempts=options["port_attempts"])
+    except OSError as exc:
+        logger.warning(f"Failed to serve metrics: {exc}")
+
+
+def connect_signals():
+    """Export metrics from Celery workers as configured in 'metrics' section of frambo config."""
+    from celery.signals import task_postrun, worker_process_init
+
+    task_postrun.connect(_write_file, weak=False, dispatch_uid=__name__)
+    worker_process_init.connect(_serve, weak=False, dispatch_uid=__name__)
@@ -1,10 +1,48 @@
-from frambo.config import get_from_frambo_config
+from frambo.config import (
+    get_from_frambo_config,
+    lazy_module_attributes,
+    settings,
+)
 
-PAGURE_HOST = get_from_frambo_config("pagure", "host")
-PAGURE_PORT = get_from_frambo_config("pagure", "port", raises=False)
+__getattr__ = lazy_module_attributes(
+    __name__, ("PAGURE_HOST", "PAGURE_PORT", "PAGURE_URL")
+)
 
-PAGURE_URL = f"https://{PAGURE_HOST}/"
+
+@settings.register("PAGURE_HOST")
+def _pagure_host():
+    return get_from_frambo_config("pagure", "host")
+
+
+@settings.register("PAGURE_PORT")
+def _pagure_port():
+    return get_from_frambo_config("pagure", "port", raises=False)
+
+
+@settings.register("PAGURE_URL")
+def _pagure_url():
+    return f"https://{settings.PAGURE_HOST}/"
 
 
 def cfg_url(repo, branch, file="bot-cfg.yml"):
-    return f"{PAGURE_URL}{repo}/raw/{branch}/f/{file}"
+    return f"{settings.PAGURE_URL}{repo}/raw/{branch}/f/{file}"
+
+
+def api_request(method, endpoint, token=None, **kwargs):
+    """
+    Call Pagure API using the process-wide HTTP session.
+
+    :param method: str, HTTP method
+    :param endpoint: str, API endpoint, e.g. '-/whoami'
+    :param token: str, API token
+    :param kwargs: passed to requests.Session.request()
+    :return: requests.Response
+    """
+    from frambo.http_client import get_session
+
+    headers = dict(kwargs.pop("headers", None) or {})
+    if token:
+        headers["Authorization"] = f"token {token}"
+    return get_session().request(
+        method, f"{settings.PAGURE_URL}api/0/{endpoint}", headers=headers, **kwargs
+    )
@@ -0,0 +1,134 @@
+# -*- coding: utf-8 -*-
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+from contextlib import contextmanager
+from functools import wraps
+from logging import getLogger
+from os import getpid
+from threading import Lock
+
+logger = getLogger(__name__)
+
+
+class BotPool(object):
+    """
+    Idle Bot instances of one process, reused by tasks.
+
+    A bot is checkout()-ed before a task uses it and reset() afterwards,
+    so per-task state is cleaned while expensive state (e.g. git mirrors, sessions)
+    survives to the next task. Forked processes start with an empty pool.
+    """
+
+    def __init__(self, factory, size=4):
+        """
+        Initialize.
+
+        :param factory: callable returning new Bot instance
+        :param size: max number of idle bots kept
+        """
+        if size < 1:
+            raise ValueError(f"size must be positive, got {size}")
+        self.factory = factory
+        self.size = size
+        self._idle = []
+        self._pid = getpid()
+        self._lock = Lock()
+
+    def __len__(self):
+        return len(self._idle)
+
+    def _take(self):
+        with self._lock:
+            if self._pid != getpid():
+                # the bots belong to the parent process
+                self._idle = []
+                self._pid = getpid()
+            if self._idle:
+                return self._idle.pop()
+        logger.debug("Creating bot instance")
+        return self.factory()
+
+    def _give_back(self, bot):
+        try:
+            bot.reset()
+        except Exception:
+            # don't risk next task getting bot in unknown state
+            logger.exception("Failed to reset bot, dropping it")
+            return
+        with self._lock:
+            if self._pid == getpid() and len(self._idle) < self.size:
+                self._idle.append(bot)
+
+    @contextmanager
+    def acquire(self):
+        """Yield a bot checked out for the caller, return it to the pool afterwards."""
+        bot = self._take()
+        bot.checkout()
+        try:
+            yield bot
+        finally:
+            self._give_back(bot)
+
+    def clear(self):
+        with self._lock:
+            self._idle = []
+
+
+_pools = {}
+_pools_lock = Lock()
+
+
+def get_pool(bot_class, size=4, **kwargs):
+    """
+    Return the process-wide pool of bot_class(**kwargs) instances.
+
+    :param bot_class: Bot subclass
+    :param size: max number of idle bots kept, used when creating the pool
+    :param kwargs: passed to bot_class()
+    :return: BotPool
+    """
+    key = (bot_class, tuple(sorted(kwargs.items())))
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None:
+            pool = _pools[key] = BotPool(lambda: bot_class(**kwargs), size=size)
+    return pool
+
+
+def pooled(bot_class, size=4, **kwargs):
+    """
+    Decorate task function to get a pooled bot_class(**kwargs) instance as first argument.
+
+        @app.task(name="task.foobar.rebuild_now")
+        @pooled(FooBarBot, task_name="task.foobar.rebuild_now")
+        def rebuild_now(bot, *args, **kwargs):
+            return bot.process(args[0])
+
+    :param bot_class: Bot subclass
+    :param size: max number of idle bots kept
+    :param kwargs: passed to bot_class()
+    """
+
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kw):
+            with get_pool(bot_class, size=size, **kwargs).acquire() as bot:
+                return func(bot, *args, **kw)
+
+        # Celery inspects signature of the task function, which doesn't include bot
+        del wrapper.__wrapped__
+        return wrapper
+
+    return decorator
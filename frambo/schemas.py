@@ -14,7 +14,16 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <https://www.gnu.org/licenses/>.
 
+from functools import lru_cache
+
 import jsl
+import jsonschema
+
+try:
+    # optional, generates python code validating the schema
+    import fastjsonschema
+except ImportError:
+    fastjsonschema = None
 
 
 class Notifications(jsl.Document):
@@ -62,6 +71,57 @@ class BotCfg(jsl.Document):
     )
 
 
+@lru_cache()
+def get_validator(document=BotCfg):
+    """
+    Return jsonschema validator for document's schema.
+    The schema is generated and checked only once per document (i.e. schema version).
+    """
+    schema = document.get_schema()
+    validator_class = jsonschema.validators.validator_for(schema)
+    validator_class.check_schema(schema)
+    return validator_class(schema)
+
+
+@lru_cache()
+def get_compiled_validator(document=BotCfg):
+    """
+    Return function validating document's schema, generated by fastjsonschema,
+    or None if fastjsonschema is not installed.
+    """
+    if fastjsonschema is None:
+        return None
+    # jsonschema.validate() doesn't check formats, neither do we
+    return fastjsonschema.compile(
+        document.get_schema(),
+        use_default=False,
+        use_formats=False,
+        detailed_exceptions=False,
+    )
+
+
+def validate(instance, document=BotCfg):
+    """
+    Validate instance against document's schema, same as jsonschema.validate(),
+    but reusing cached validators.
+
+    The compiled validator is tried first and the slower jsonschema one
+    is used only when it fails, to tell what's wrong.
+
+    :param instance: configuration to validate
+    :param document: jsl.Document subclass
+    :raises jsonschema.ValidationError: if instance is invalid
+    """
+    compiled = get_compiled_validator(document)
+    if compiled:
+        try:
+            compiled(instance)
+            return
+        except fastjsonschema.JsonSchemaException:
+            pass
+    get_validator(document).validate(instance)
+
+
 if __name__ == "__main__":
     from pprint import pprint
 
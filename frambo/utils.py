@@ -14,14 +14,16 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 from contextlib import contextmanager
-import jinja2
 from logging import getLogger
 import os
 import subprocess
 
+from frambo.metrics import timed
+
 logger = getLogger(__name__)
 
 
+@timed("run_cmd")
 def run_cmd(cmd, return_output=False, ignore_error=False, shell=False, **kwargs):
     """
     Run provided command on host system using the same user as invoked this code.
@@ -87,6 +89,8 @@ def text_from_template(template_dir, template_filename, template_data):
     if not os.path.exists(os.path.join(template_dir, template_filename)):
         raise FileNotFoundError("Path to template not found.")
 
+    import jinja2
+
     template_loader = jinja2.FileSystemLoader(searchpath=template_dir)
     template_env = jinja2.Environment(loader=template_loader)
     template = template_env.get_template(template_filename)
@@ -95,3 +99,66 @@ def text_from_template(template_dir, template_filename, template_data):
     logger.debug(output_text)
 
     return output_text
+
+
+class FrozenDict(dict):
+    """
+    Read-only dict.
+
+    It's still a dict, so it can be validated, serialized or compared as any other dict.
+    dict(frozen) and copy.copy() return shallow writable copy, copy.deepcopy() a deep one.
+    """
+
+    def _read_only(self, *args, **kwargs):
+        raise TypeError(f"{type(self).__name__} is read-only")
+
+    __setitem__ = __delitem__ = __ior__ = _read_only
+    clear = pop = popitem = setdefault = update = _read_only
+
+    def __copy__(self):
+        return dict(self)
+
+    def __deepcopy__(self, memo):
+        return thaw(self)
+
+    def __reduce__(self):
+        return type(self), (dict(self),)
+
+
+class FrozenList(list):
+    """Read-only list, see FrozenDict."""
+
+    def _read_only(self, *args, **kwargs):
+        raise TypeError(f"{type(self).__name__} is read-only")
+
+    __setitem__ = __delitem__ = __iadd__ = __imul__ = _read_only
+    append = clear = extend = insert = pop = remove = reverse = sort = _read_only
+
+    def __copy__(self):
+        return list(self)
+
+    def __deepcopy__(self, memo):
+        return thaw(self)
+
+    def __reduce__(self):
+        return type(self), (list(self),)
+
+
+def freeze(obj):
+    """Return read-only copy of obj, recursively converting dicts and lists."""
+    if isinstance(obj, (FrozenDict, FrozenList)):
+        return obj
+    if isinstance(obj, dict):
+        return FrozenDict((k, freeze(v)) for k, v in obj.items())
+    if isinstance(obj, list):
+        return FrozenList(freeze(v) for v in obj)
+    return obj
+
+
+def thaw(obj):
+    """Return writable deep copy of obj, the opposite of freeze()."""
+    if isinstance(obj, dict):
+        return {k: thaw(v) for k, v in obj.items()}
+    if isinstance(obj, list):
+        return [thaw(v) for v in obj]
+    return obj
@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+from importlib import import_module
+from logging import getLogger
+from os import getenv
+
+logger = getLogger(__name__)
+
+_parser = None
+
+
+def safe_load(stream):
+    """yaml.safe_load(), using libyaml's (much faster) CSafeLoader if available."""
+    import yaml
+
+    loader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+    return yaml.load(stream, Loader=loader)
+
+
+def get_yaml_parser():
+    """
+    Return function used to parse YAML, safe_load() by default.
+
+    Alternative parser, i.e. a function accepting str or a file object
+    and returning python objects, can be set by set_yaml_parser() or
+    by FRAMBO_YAML_PARSER='module:function' environment variable.
+    """
+    global _parser
+    if _parser is None:
+        name = getenv("FRAMBO_YAML_PARSER")
+        if name:
+            module, _, function = name.partition(":")
+            _parser = getattr(import_module(module), function)
+            logger.debug(f"Using {name} to parse YAML")
+        else:
+            _parser = safe_load
+    return _parser
+
+
+def set_yaml_parser(parser):
+    """
+    Set function used to parse YAML.
+
+    :param parser: callable accepting str or file object, None to use the default one
+    """
+    global _parser
+    _parser = parser
+
+
+def load_yaml(stream):
+    """
+    Parse YAML document.
+
+    :param stream: str or file object
+    :return: python object
+    """
+    return get_yaml_parser()(stream)
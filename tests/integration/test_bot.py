@@ -1,9 +1,11 @@
 """Test Bot class"""
 
 from flexmock import flexmock
+import logging
 from pathlib import Path
 import pytest
 
+from frambo import config, metrics
 from frambo.bot import Bot
 
 
@@ -22,3 +24,60 @@ class TestBot:
     def test_is_enabled(self, bot, config_path, key, result):
         flexmock(bot, cfg_key=key)
         assert bot.is_enabled(config_path=config_path) == result
+
+    def test_log_level(self, bot):
+        bot.logger.logger.setLevel(logging.INFO)
+        flexmock(bot).should_receive("log").with_args(logging.INFO, "shown").once()
+        flexmock(bot.logger).should_receive("format").never()
+        bot.debug("hidden %s", "argument")
+        bot.info("shown")
+
+    def test_handlers(self):
+        records = []
+        handler = logging.Handler()
+        handler.emit = records.append
+        Bot().logger.logger.addHandler(handler)
+        try:
+            handlers = list(Bot().logger.logger.handlers)
+            for _ in range(2000):
+                bot = Bot()
+            # no handlers pile up, each record is handled once
+            assert bot.logger.logger.handlers == handlers
+            bot.info("hello")
+            assert len(records) == 1
+        finally:
+            bot.logger.logger.removeHandler(handler)
+
+    def test_metrics(self, config_path):
+        class TimedBot(Bot):
+            cfg_key = "dockerfile-linter"
+
+            def process(self, msg):
+                return msg
+
+        bot = TimedBot(task_name="task.test.metrics")
+        assert bot.process("hello") == "hello"
+        assert bot.is_enabled(config_path=config_path)
+        for phase in ("process", "is_enabled"):
+            histogram = metrics.registry.get(
+                metrics.PHASE_DURATION, phase=phase, task="task.test.metrics"
+            )
+            assert histogram.count >= 1
+
+    def test_is_enabled_lazy(self, bot, config_path):
+        flexmock(bot, cfg_key="dockerfile-linter")
+        config.settings.RESOLVED_CACHE.clear()
+        config.settings.ENABLED_CACHE.clear()
+        flexmock(config).should_receive("_resolve_configuration").never()
+        assert bot.is_enabled(config_path=config_path)
+        # resolved when needed
+        flexmock(config).should_call("_resolve_configuration").once()
+        assert bot.config["enabled"]
+        assert bot.is_enabled()
+
+    def test_is_enabled_no_file(self, bot, tmp_path):
+        flexmock(bot, cfg_key="dockerfile-linter")
+        with pytest.raises(AttributeError):
+            bot.is_enabled(config_path=tmp_path / "bot-cfg.yml")
+        with pytest.raises(RuntimeError):
+            bot.is_enabled()
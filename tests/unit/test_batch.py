@@ -0,0 +1,79 @@
+"""Test batch processing."""
+
+from celery import Celery
+from flexmock import flexmock
+import pytest
+
+from frambo.batch import batch_task, group_messages, send_batches
+from frambo.bot import BatchResult, Bot
+
+
+class RepoBot(Bot):
+    def __init__(self, task_name=None):
+        super().__init__(task_name=task_name)
+        self.clones = 0
+
+    def process_batch(self, msgs):
+        # shared work
+        self.clones += 1
+        return super().process_batch(msgs)
+
+    def process(self, msg):
+        if msg["action"] == "fail":
+            raise ValueError(msg["repo"])
+        return f"{msg['repo']} {msg['action']}"
+
+
+def repo(msg):
+    return msg["repo"]
+
+
+MSGS = [
+    {"repo": "a", "action": "push"},
+    {"repo": "b", "action": "push"},
+    {"repo": "a", "action": "fail"},
+    {"repo": "a", "action": "tag"},
+]
+
+
+class TestBatch:
+    @pytest.mark.parametrize(
+        "max_size, expected",
+        [
+            (100, [[MSGS[0], MSGS[2], MSGS[3]], [MSGS[1]]]),
+            (2, [[MSGS[0], MSGS[2]], [MSGS[3]], [MSGS[1]]]),
+        ],
+    )
+    def test_group_messages(self, max_size, expected):
+        assert group_messages(MSGS, repo, max_size=max_size) == expected
+
+    def test_process_batch(self):
+        bot = RepoBot()
+        flexmock(bot).should_receive("exception").once()
+        assert bot.process_batch(MSGS[:3]) == [
+            BatchResult(MSGS[0], "a push", None),
+            BatchResult(MSGS[1], "b push", None),
+            BatchResult(MSGS[2], None, "ValueError('a')"),
+        ]
+
+    def test_batch_task(self):
+        app = Celery()
+        task = batch_task(app, "task.test.batch", RepoBot)
+        assert task.name == "task.test.batch"
+        results = task.apply(args=(MSGS[:3],)).get()
+        assert [result["error"] for result in results] == [
+            None,
+            None,
+            "ValueError('a')",
+        ]
+        assert results[0] == {"msg": MSGS[0], "result": "a push", "error": None}
+
+    def test_send_batches(self):
+        app = flexmock()
+        app.should_receive("send_task").with_args(
+            "task.test.batch", args=([MSGS[0], MSGS[2], MSGS[3]],), queue="q"
+        ).once()
+        app.should_receive("send_task").with_args(
+            "task.test.batch", args=([MSGS[1]],), queue="q"
+        ).once()
+        assert len(send_batches(app, "task.test.batch", MSGS, repo, queue="q")) == 2
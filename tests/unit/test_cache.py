@@ -0,0 +1,147 @@
+"""Test caches."""
+
+import pytest
+from requests import ConnectionError
+
+from frambo.cache import ConfigCache, LRUCache
+
+
+class FakeResponse:
+    def __init__(self, status_code, text="", headers=None):
+        self.status_code = status_code
+        self.text = text
+        self.headers = headers or {}
+
+
+class FakeServer:
+    """Records requests and returns prepared responses."""
+
+    def __init__(self, *responses):
+        self.responses = list(responses)
+        self.requests = []
+
+    def __call__(self, url, headers):
+        self.requests.append((url, headers))
+        response = self.responses.pop(0)
+        if isinstance(response, Exception):
+            raise response
+        return response
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0
+
+    def __call__(self):
+        return self.now
+
+
+class TestLRUCache:
+    def test_eviction(self):
+        cache = LRUCache(maxsize=2)
+        cache.put("a", 1)
+        cache.put("b", 2)
+        assert cache.get("a") == 1
+        cache.put("c", 3)
+        # 'b' is the least recently used one
+        assert "b" not in cache
+        assert cache.get("a") == 1
+        assert cache.get("c") == 3
+        assert cache.get("b") is None
+        assert cache.stats == {"hits": 3, "misses": 1, "evictions": 1}
+
+    def test_maxsize(self):
+        with pytest.raises(ValueError):
+            LRUCache(maxsize=0)
+
+
+class TestConfigCache:
+    url = "https://pagure.io/foo/raw/master/f/bot-cfg.yml"
+
+    @pytest.fixture
+    def clock(self):
+        return Clock()
+
+    def test_ttl_and_revalidation(self, clock):
+        cache = ConfigCache(ttl=10, clock=clock)
+        server = FakeServer(
+            FakeResponse(200, "v1", {"ETag": '"1"', "Last-Modified": "yesterday"}),
+            FakeResponse(304),
+            FakeResponse(200, "v2", {"ETag": '"2"'}),
+        )
+        assert cache.get(self.url, server) == "v1"
+        assert server.requests == [(self.url, {})]
+
+        # fresh, no request
+        clock.now = 9
+        assert cache.get(self.url, server) == "v1"
+        assert len(server.requests) == 1
+
+        # stale, revalidated -> not modified
+        clock.now = 10
+        assert cache.get(self.url, server) == "v1"
+        assert server.requests[-1] == (
+            self.url,
+            {"If-None-Match": '"1"', "If-Modified-Since": "yesterday"},
+        )
+        # revalidation restarts ttl
+        clock.now = 19
+        assert cache.get(self.url, server) == "v1"
+        assert len(server.requests) == 2
+
+        # revalidated -> changed
+        clock.now = 20
+        assert cache.get(self.url, server) == "v2"
+        assert cache.get(self.url, server) == "v2"
+        assert len(server.requests) == 3
+        assert cache.stats == {
+            "misses": 1,
+            "hits": 3,
+            "revalidations": 2,
+            "not_modified": 1,
+        }
+
+    @pytest.mark.parametrize(
+        "failure",
+        [
+            FakeResponse(503),
+            FakeResponse(429),
+            FakeResponse(403),
+            ConnectionError("Pagure is down"),
+        ],
+    )
+    def test_serve_stale(self, clock, failure):
+        cache = ConfigCache(ttl=10, clock=clock)
+        server = FakeServer(FakeResponse(200, "v1"), failure)
+        cache.get(self.url, server)
+        clock.now = 100
+        assert cache.get(self.url, server) == "v1"
+        assert cache.stats["stale"] == 1
+
+    def test_no_stale(self, clock):
+        cache = ConfigCache(ttl=10, serve_stale=False, clock=clock)
+        server = FakeServer(FakeResponse(200, "v1"), ConnectionError())
+        cache.get(self.url, server)
+        clock.now = 100
+        with pytest.raises(ConnectionError):
+            cache.get(self.url, server)
+
+    @pytest.mark.parametrize("status_code", [404, 410])
+    def test_not_found(self, clock, status_code):
+        cache = ConfigCache(ttl=10, clock=clock)
+        server = FakeServer(FakeResponse(200, "v1"), FakeResponse(status_code))
+        cache.get(self.url, server)
+        clock.now = 100
+        assert cache.get(self.url, server) is None
+        assert len(cache) == 0
+
+    def test_error_no_stale(self, clock):
+        cache = ConfigCache(ttl=10, serve_stale=False, clock=clock)
+        server = FakeServer(
+            FakeResponse(200, "v1"), FakeResponse(429), FakeResponse(304)
+        )
+        cache.get(self.url, server)
+        clock.now = 100
+        assert cache.get(self.url, server) is None
+        # the file isn't forgotten because of rate limiting
+        assert cache.get(self.url, server) == "v1"
@@ -0,0 +1,88 @@
+"""Test coalescing of events."""
+
+from flexmock import flexmock
+
+from frambo.coalesce import COALESCED_EVENTS, Coalescer, MemoryBackend, RedisBackend
+from frambo.metrics import registry
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0
+
+    def __call__(self):
+        return self.now
+
+
+class TestCoalescer:
+    def test_claim(self):
+        clock = Clock()
+        coalescer = Coalescer(MemoryBackend(clock=clock), window=10)
+        before = registry.get(COALESCED_EVENTS, bot="test-bot") or 0
+        assert coalescer.claim("test-bot", "foo/bar", "master")
+        clock.now = 5
+        assert not coalescer.claim("test-bot", "foo/bar", "master")
+        # other branch, repo or bot
+        assert coalescer.claim("test-bot", "foo/bar", "devel")
+        assert coalescer.claim("test-bot", "foo/baz", "master")
+        assert coalescer.claim("other-bot", "foo/bar", "master")
+        # window is over
+        clock.now = 10
+        assert coalescer.claim("test-bot", "foo/bar", "master")
+        assert registry.get(COALESCED_EVENTS, bot="test-bot") == before + 1
+
+    def test_window_default(self):
+        assert Coalescer(MemoryBackend()).window == 30
+
+    def test_send_task(self):
+        coalescer = Coalescer(MemoryBackend(), window=10)
+        app = flexmock()
+        app.should_receive("send_task").with_args(
+            "task.test.run", countdown=10, args=("foo/bar",)
+        ).and_return("result").once()
+        for _ in range(3):
+            result = coalescer.send_task(
+                app, "task.test.run", "test-bot", "foo/bar", "master", args=("foo/bar",)
+            )
+        assert result is None
+
+    def test_send_task_countdown(self):
+        clock = Clock()
+        coalescer = Coalescer(MemoryBackend(clock=clock), window=10)
+        app = flexmock()
+        app.should_receive("send_task").with_args(
+            "task.test.run", countdown=3
+        ).and_return("result").twice()
+
+        def send():
+            return coalescer.send_task(
+                app, "task.test.run", "test-bot", "foo/bar", "master", countdown=3
+            )
+
+        assert send() == "result"
+        assert send() is None
+        # the run started, events after it schedule another one
+        clock.now = 3
+        assert send() == "result"
+
+    def test_release(self):
+        coalescer = Coalescer(MemoryBackend(), window=10)
+        assert coalescer.claim("test-bot", "foo/bar", "master")
+        coalescer.release("test-bot", "foo/bar", "master")
+        assert coalescer.claim("test-bot", "foo/bar", "master")
+        assert not coalescer.claim("test-bot", "foo/bar", "master")
+        # releasing what isn't claimed is fine
+        coalescer.release("test-bot", "foo/bar", "devel")
+
+    def test_redis_backend(self):
+        client = flexmock()
+        client.should_receive("set").with_args(
+            "frambo:coalesce:test-bot:foo/bar:master", 1, nx=True, px=1500
+        ).and_return(True).and_return(None).twice()
+        coalescer = Coalescer(RedisBackend(client), window=1.5)
+        assert coalescer.claim("test-bot", "foo/bar", "master")
+        assert not coalescer.claim("test-bot", "foo/bar", "master")
+        client.should_receive("delete").with_args(
+            "frambo:coalesce:test-bot:foo/bar:master"
+        ).once()
+        coalescer.release("test-bot", "foo/bar", "master")
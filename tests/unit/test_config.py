@@ -1,9 +1,46 @@
+import copy
 import json
 from pathlib import Path
+import subprocess
+import sys
 
+from flexmock import flexmock
+from hypothesis import given, strategies as st
+from jsonschema import ValidationError
 import pytest
 
 from frambo import config
+from frambo.http_client import get_session
+
+# keys colliding with aliases are the interesting ones
+KEYS = st.sampled_from(
+    ["a", "b", "global", "zdravomil", "dockerfile-linter", "betka", "enabled"]
+)
+DOCUMENTS = st.dictionaries(
+    KEYS,
+    st.recursive(
+        st.none() | st.booleans() | st.integers() | st.lists(st.integers()),
+        lambda children: st.dictionaries(KEYS, children, max_size=4),
+        max_leaves=10,
+    ),
+    max_size=5,
+)
+
+
+def merge_configuration_reference(defaults, repo_conf):
+    """How load_configuration() used to merge bot-cfg.yml into defaults."""
+    result = copy.deepcopy(defaults)
+    repo_conf = copy.deepcopy(repo_conf)
+    for key in config.settings.BOT_CONF_KEYS:
+        try:
+            config.dict_merge(
+                into_dct=result.get(key, {}), from_dct=repo_conf.get("global", {})
+            )
+        except AttributeError:
+            pass
+    repo_conf.pop("global", None)
+    config.dict_merge(into_dct=result, from_dct=repo_conf)
+    return result
 
 
 class TestConfig:
@@ -25,6 +62,66 @@ class TestConfig:
         assert dct["b"]["b3"] == 5
         assert dct["c"] == 6
 
+    @given(into=DOCUMENTS, from_=DOCUMENTS)
+    def test_merge_dicts(self, into, from_):
+        expected = copy.deepcopy(into)
+        config.dict_merge(expected, copy.deepcopy(from_))
+        into_copy, from_copy = copy.deepcopy(into), copy.deepcopy(from_)
+
+        assert config.merge_dicts(into, from_) == expected
+        # inputs are untouched
+        assert into == into_copy
+        assert from_ == from_copy
+
+    @given(
+        defaults=st.fixed_dictionaries(
+            {"dockerfile-linter": DOCUMENTS},
+            optional={"upstream-to-downstream": DOCUMENTS},
+        ),
+        repo_conf=DOCUMENTS,
+        global_conf=DOCUMENTS | st.none() | st.text(max_size=3),
+    )
+    def test_merge_configuration(self, defaults, repo_conf, global_conf):
+        repo_conf["global"] = global_conf
+        assert config.merge_configuration(
+            defaults, repo_conf
+        ) == merge_configuration_reference(defaults, repo_conf)
+
+    @given(
+        repo_conf=DOCUMENTS,
+        global_conf=DOCUMENTS | st.none() | st.text(max_size=3),
+        key=st.sampled_from(["dockerfile-linter", "upstream-to-downstream"]),
+    )
+    def test_enabled(self, repo_conf, global_conf, key):
+        repo_conf["global"] = global_conf
+        enabled = config._enabled(key, repo_conf)
+        if enabled is not None:
+            merged = config.merge_configuration(config.load_defaults(), repo_conf)
+            assert enabled == merged[key].get("enabled", False)
+
+    @pytest.mark.parametrize(
+        "bot_cfg, key",
+        [
+            ("bot-cfg.yml", "dockerfile-linter"),
+            ("bot-cfg-default.yml", "dockerfile-linter"),
+            ("bot-cfg-old-keys.yml", "zdravomil"),
+        ],
+    )
+    def test_config_enabled(self, bot_cfg, key):
+        conf_str = (
+            Path(__file__).parent.parent / "data/bot-configs" / bot_cfg
+        ).read_text()
+        config.settings.RESOLVED_CACHE.clear()
+        config.settings.ENABLED_CACHE.clear()
+        flexmock(config).should_receive("_resolve_configuration").never()
+        enabled = config.config_enabled(key, conf_str)
+        flexmock(config).should_call("_resolve_configuration").once()
+        resolved = config.load_configuration(conf_str=conf_str)
+        assert enabled == resolved[config.alias2key(key)].get("enabled", False)
+        # resolved configuration is used when there's one
+        config.settings.ENABLED_CACHE.clear()
+        assert config.config_enabled(key, conf_str) == enabled
+
     @pytest.mark.parametrize(
         "bot_cfg_path",
         [
@@ -47,6 +144,36 @@ class TestConfig:
         with pytest.raises(AttributeError):
             config.load_configuration(conf_path="/does/not/exist")
 
+    def test_load_defaults_once(self):
+        config.load_defaults.cache_clear()
+        config.RESOLVED_CACHE.clear()
+        # once for defaults, once for the conf_str below
+        flexmock(config).should_call("load_yaml").twice()
+        for _ in range(3):
+            conf = config.load_configuration()
+        assert conf == config.load_defaults()
+        with pytest.raises(TypeError):
+            conf["dockerfile-linter"]["enabled"] = False
+
+        conf = config.load_configuration(conf_str="zdravomil: {enabled: false}")
+        assert conf["dockerfile-linter"]["enabled"] is False
+        # defaults haven't been touched
+        assert config.load_defaults()["dockerfile-linter"]["enabled"] is True
+
+    def test_load_configuration_cached(self):
+        config.RESOLVED_CACHE.clear()
+        conf_str = "version: '1'\nbetka: {enabled: false}\n"
+        conf = config.load_configuration(conf_str=conf_str)
+        assert config.load_configuration(conf_str=conf_str) is conf
+        assert config.RESOLVED_CACHE.stats == {"misses": 1, "hits": 1}
+        with pytest.raises(TypeError):
+            conf["upstream-to-downstream"]["enabled"] = True
+
+        # different defaults -> different configuration
+        flexmock(config).should_receive("defaults_version").and_return("v2")
+        assert config.load_configuration(conf_str=conf_str) is not conf
+        assert len(config.RESOLVED_CACHE) == 2
+
     def test_load_configuration_with_aliases(self):
         my = {
             "version": "2",
@@ -73,6 +200,53 @@ class TestConfig:
         assert c3 == c4
         assert "notifications" in c3
 
+    def test_fetch_config_cached(self):
+        url = "https://pagure.io/foo/raw/master/f/bot-cfg.yml"
+        response = flexmock(
+            status_code=200,
+            text=(
+                Path(__file__).parent.parent / "data/bot-configs/bot-cfg.yml"
+            ).read_text(),
+            headers={},
+        )
+        flexmock(get_session()).should_receive("get").and_return(response).once()
+        config.CONFIG_CACHE.clear()
+        c1 = config.fetch_config("zdravomil", url)
+        c2 = config.fetch_config("dockerfile-linter", url)
+        assert c1 == c2
+        assert config.CONFIG_CACHE.stats == {"misses": 1, "hits": 1}
+
+    def test_fetch_configs(self):
+        bot_cfg = Path(__file__).parent.parent / "data/bot-configs/bot-cfg.yml"
+        files = {
+            "https://pagure.io/ok/raw/master/f/bot-cfg.yml": (200, bot_cfg.read_text()),
+            "https://pagure.io/missing/raw/master/f/bot-cfg.yml": (404, ""),
+            "https://pagure.io/bad/raw/master/f/bot-cfg.yml": (200, "betka: [1]"),
+        }
+
+        def get(url, **kwargs):
+            status_code, text = files[url]
+            return flexmock(status_code=status_code, text=text, headers={})
+
+        flexmock(get_session()).should_receive("get").replace_with(get)
+        config.CONFIG_CACHE.clear()
+        results = {
+            r.repo: r
+            for r in config.fetch_configs(
+                {url.split("/")[3]: url for url in files}, config_key="zdravomil"
+            )
+        }
+        assert results["ok"].config["notifications"] == {
+            "email_addresses": ["jozko@mrkvicka.com"]
+        }
+        assert results["missing"].config == {"enabled": True}
+        assert results["missing"].error is None
+        assert isinstance(results["bad"].error, ValidationError)
+        assert results["bad"].config is None
+
+        with pytest.raises(AttributeError):
+            next(config.fetch_configs({}, config_key="unknown"))
+
     def test_get_from_frambo_config(self):
         assert config.get_from_frambo_config("emails", "sender")
         assert config.get_from_frambo_config("pagure", "host")
@@ -90,3 +264,81 @@ class TestConfig:
         path = Path(__file__).parent.parent / "data/configs/" / data_path
         with pytest.raises(Exception):
             config.frambo_config(path)
+
+    @pytest.mark.parametrize(
+        "module", ["frambo.git", "frambo.config", "frambo.pagure", "frambo.emails"]
+    )
+    def test_import_is_cheap(self, module):
+        """Importing a module doesn't load configuration nor heavy dependencies."""
+        heavy = [
+            "yaml",
+            "jsonschema",
+            "jsl",
+            "requests",
+            "jinja2",
+            "celery",
+            "http.server",
+            "asyncio",
+        ]
+        loaded = subprocess.check_output(
+            [
+                sys.executable,
+                "-c",
+                f"import sys, {module}; print(*(m for m in {heavy} if m in sys.modules))",
+            ],
+            # no DEPLOYMENT needed either
+            env={"PATH": ""},
+            cwd=Path(__file__).parent.parent.parent,
+            universal_newlines=True,
+        )
+        assert loaded.split() == []
+
+    def test_frambo_config_reload(self, tmp_path, monkeypatch):
+        cfgfile = tmp_path / "config.yml"
+        original = (config.CONFIG_DIR / "config.yml").read_text()
+        cfgfile.write_text(original.replace("reload-interval: 1", "reload-interval: 0"))
+        monkeypatch.setattr(config, "CONFIG_DIR", tmp_path)
+        config.reset_frambo_config()
+        try:
+            assert config.alias2key("zdravomil") == "dockerfile-linter"
+            cache = config.settings.CONFIG_CACHE
+
+            # unchanged file isn't reloaded
+            assert config.frambo_config() is config.frambo_config()
+
+            cfgfile.write_text(
+                cfgfile.read_text()
+                .replace("zdravomil: dockerfile-linter", "linter: dockerfile-linter")
+                .replace("cache-ttl: 300", "cache-ttl: 10")
+            )
+            # any read of the configuration notices the change
+            config.load_configuration()
+            assert config.alias2key("zdravomil") == "zdravomil"
+            assert config.alias2key("linter") == "dockerfile-linter"
+            # caches survive with new settings
+            assert config.settings.CONFIG_CACHE is cache
+            assert cache.ttl == 10
+
+            # broken file is ignored
+            cfgfile.write_text("{")
+            config.load_configuration()
+            assert config.alias2key("linter") == "dockerfile-linter"
+
+            # so is (temporarily) missing one
+            cfgfile.unlink()
+            config.load_configuration()
+            assert config.alias2key("linter") == "dockerfile-linter"
+        finally:
+            monkeypatch.undo()
+            config.reset_frambo_config()
+
+    def test_settings(self):
+        assert config.settings.BOT_CONF_KEYS == {
+            "dockerfile-linter",
+            "upstream-to-downstream",
+        }
+        assert config.BOT_CONF_KEYS is config.settings.BOT_CONF_KEYS
+        with pytest.raises(AttributeError):
+            config.settings.NOT_A_SETTING
+        with pytest.raises(AttributeError):
+            config.NOT_A_SETTING
@@ -1,10 +1,21 @@
 """Test Git class."""
 
+import asyncio
 from subprocess import CalledProcessError
+from threading import Thread
 from os.path import isdir, isfile, join
+from shutil import rmtree
+from time import monotonic
+
+from hypothesis import given, strategies as st
 import pytest
 
-from frambo.git import Git
+from frambo import git
+from frambo.git import AsyncGit, CatFile, Git, GitMirrors, cat_file
+from frambo.utils import run_cmd
+
+# user & repo names which don't look like ports
+NAMES = st.from_regex(r"\A[a-zA-Z][a-zA-Z0-9_-]{0,15}\Z")
 
 
 class TestGit(object):
@@ -13,6 +24,27 @@ class TestGit(object):
     def test_call_git_cmd(self):
         assert Git.call_git_cmd("version").startswith("git version")
 
+    @pytest.mark.parametrize("shell", [None, False])
+    def test_call_git_cmd_argv(self, tmpdir, shell):
+        repo = str(tmpdir.mkdir("with space"))
+        Git.call_git_cmd(["init", "--quiet", repo], shell=shell)
+        commit(repo, "file name.txt", "content")
+        output = Git.call_git_cmd(["ls-files"], git_dir=repo, shell=shell)
+        assert output.strip() == "file name.txt"
+        output = Git.call_git_cmd("rev-parse --show-toplevel", cwd=repo, shell=shell)
+        assert output.strip() == repo
+
+    def test_call_git_cmd_env(self):
+        output = Git.call_git_cmd(
+            ["var", "GIT_AUTHOR_IDENT"],
+            env={"GIT_AUTHOR_NAME": "Frambo Bot", "GIT_AUTHOR_EMAIL": "f@ram.bo"},
+        )
+        assert output.startswith("Frambo Bot <f@ram.bo>")
+
+    def test_call_git_cmd_invalid(self):
+        with pytest.raises(ValueError):
+            Git.call_git_cmd(("status",))
+
     @pytest.mark.parametrize(
         "url, ok",
         [
@@ -56,6 +88,61 @@ class TestGit(object):
         assert Git.get_username_from_git_url(url) == "foo"
         assert Git.get_reponame_from_git_url(url) == "bar"
 
+    @given(
+        user=NAMES,
+        repo=NAMES,
+        host=st.from_regex(r"\A[a-z][a-z0-9]{0,8}(\.[a-z][a-z0-9]{0,8}){1,3}\Z"),
+        form=st.sampled_from(
+            [
+                "{host}/{user}/{repo}",
+                "www.{host}/{user}/{repo}",
+                "{scheme}{host}/{user}/{repo}",
+                "{scheme}www.{host}/{user}/{repo}",
+                "git@{host}:{user}/{repo}",
+                "ssh://git@{host}:{user}/{repo}",
+                "git+ssh@{host}:{user}/{repo}",
+            ]
+        ),
+        scheme=st.sampled_from(["http://", "https://", "git://", "git+https://"]),
+        dot_git=st.booleans(),
+    )
+    def test_parse_git_repo_forms(self, user, repo, host, form, scheme, dot_git):
+        """All forms from parse_git_repo() docstring."""
+        url = form.format(host=host, user=user, repo=repo, scheme=scheme)
+        url += ".git" if dot_git else ""
+        assert git._parse_git_repo(url) == (user, repo)
+        assert Git.parse_git_repo(url) == (user, repo)
+        # cached result is the same
+        assert Git.parse_git_repo(url) == (user, repo)
+        assert Git.parse_git_repos([url, f"{url}/x", url]) == [
+            (user, repo),
+            git._parse_git_repo(f"{url}/x"),
+            (user, repo),
+        ]
+
+    @given(url=st.one_of(st.none(), st.text()))
+    def test_parse_git_repo_any(self, url):
+        def outcome(parse):
+            try:
+                return parse()
+            except ValueError as ex:
+                # e.g. urlparse() of "[" fails
+                return type(ex)
+
+        expected = outcome(lambda: git._parse_git_repo(url))
+        assert outcome(lambda: Git.parse_git_repo(url)) == expected
+        assert outcome(lambda: Git.parse_git_repos([url])[0]) == expected
+
+    def test_parse_git_repo_cache(self):
+        git._cached_parse_git_repo.cache_clear()
+        for _ in range(3):
+            Git.get_reponame_from_git_url("https://github.com/user-cont/frambo")
+        info = git._cached_parse_git_repo.cache_info()
+        assert (info.hits, info.misses) == (2, 1)
+        assert info.maxsize == git.PARSE_CACHE_SIZE
+        Git.parse_git_repos(["https://github.com/user-cont/kwaciaren"])
+        assert git._cached_parse_git_repo.cache_info().currsize == 1
+
     @pytest.mark.parametrize(
         "url", ["something", "something@else", "http://github.com/user/repo/something"]
     )
@@ -79,3 +166,228 @@ class TestGit(object):
         user_name = "Jara Cimrman"
         Git.create_dot_gitconfig(user_name=user_name, user_email="mail")
         assert Git.call_git_cmd(f"config --get user.name").strip() == user_name
+
+
+def commit(repo, name, content):
+    with open(join(repo, name), "w") as f:
+        f.write(content)
+    run_cmd(["git", "-C", repo, "add", name])
+    run_cmd(
+        ["git", "-C", repo, "-c", "user.name=Frambo", "-c", "user.email=f@ram.bo"]
+        + ["commit", "--quiet", "-m", name]
+    )
+
+
+@pytest.fixture()
+def origin(tmpdir):
+    repo = str(tmpdir.mkdir("origin"))
+    run_cmd(["git", "init", "--quiet", repo])
+    commit(repo, "README.md", "frambo")
+    return f"file://{repo}"
+
+
+class TestGitMirrors(object):
+    """Test GitMirrors class."""
+
+    def test_worktree(self, tmpdir, origin):
+        mirrors = GitMirrors(str(tmpdir.join("cache")), max_bytes=0)
+        with mirrors.worktree(origin) as path:
+            with open(join(path, "README.md")) as f:
+                assert f.read() == "frambo"
+        assert not isdir(path)
+        assert mirrors.mirrors() == [mirrors.path(origin)]
+
+        # new commits are fetched into the existing mirror
+        commit(origin[len("file://") :], "new.txt", "new")
+        with mirrors.worktree(origin) as path:
+            assert isfile(join(path, "new.txt"))
+
+    def test_concurrent_mirror(self, tmpdir, origin):
+        mirrors = GitMirrors(str(tmpdir.join("cache")), max_bytes=0)
+        threads = [Thread(target=mirrors.mirror, args=(origin,)) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert mirrors.mirrors() == [mirrors.path(origin)]
+        assert not list(tmpdir.join("cache").visit("*.tmp"))
+
+    def test_evict(self, tmpdir, origin):
+        mirrors = GitMirrors(str(tmpdir.join("cache")), max_bytes=1)
+        other = str(tmpdir.mkdir("other"))
+        run_cmd(["git", "init", "--quiet", other])
+        commit(other, "README.md", "other")
+
+        first = mirrors.mirror(origin)
+        with mirrors.worktree(f"file://{other}"):
+            # mirror in use is kept
+            assert mirrors.mirrors() == [mirrors.path(f"file://{other}")]
+            assert not first.exists()
+            mirrors.mirror(origin)
+            assert len(mirrors.mirrors()) == 2
+        # the least recently used one is removed, the current one is kept
+        mirrors.mirror(origin)
+        assert mirrors.mirrors() == [first]
+
+    def test_size(self, tmpdir, origin, monkeypatch):
+        mirrors = GitMirrors(str(tmpdir.join("cache")), max_bytes=10**9)
+        mirror = mirrors.mirror(origin)
+        size = mirrors.size(mirror)
+        assert size == git._disk_usage(mirror)
+        # evict() doesn't walk the mirrors, sizes are updated by clone/fetch
+        monkeypatch.setattr(git, "_disk_usage", lambda path: 1 / 0)
+        mirrors.evict()
+        mirrors.mirror(origin, fetch=False)
+        monkeypatch.undo()
+        commit(origin[len("file://") :], "new.txt", "new" * 1000)
+        mirrors.mirror(origin)
+        assert mirrors.size(mirror) > size
+
+    def test_evict_before_worktree(self, tmpdir, origin, monkeypatch):
+        """Another process evicts mirrors right after mirror() released its lock."""
+        cache_dir = str(tmpdir.join("cache"))
+        mirrors = GitMirrors(cache_dir, max_bytes=0)
+        mirror = mirrors.mirror
+
+        def mirror_and_evict(url, fetch=True):
+            path = mirror(url, fetch=fetch)
+            GitMirrors(cache_dir, max_bytes=1).evict()
+            return path
+
+        monkeypatch.setattr(mirrors, "mirror", mirror_and_evict)
+        with mirrors.worktree(origin) as path:
+            assert isfile(join(path, "README.md"))
+
+
+class TestCatFile(object):
+    """Test CatFile class."""
+
+    @pytest.fixture()
+    def repo(self, tmpdir):
+        repo = str(tmpdir.mkdir("repo"))
+        run_cmd(["git", "init", "--quiet", repo])
+        commit(repo, "Dockerfile", "FROM fedora\n")
+        commit(repo, "empty", "")
+        commit(repo, "Dockerfile", "FROM centos\n")
+        return repo
+
+    def test_read(self, repo):
+        with CatFile(repo) as reader:
+            assert reader.read("HEAD", "Dockerfile") == b"FROM centos\n"
+            assert reader.read("HEAD~2", "Dockerfile") == b"FROM fedora\n"
+            assert reader.read("HEAD", "empty") == b""
+            content = reader.read("HEAD", "Dockerfile", as_memoryview=True)
+            assert isinstance(content, memoryview)
+            assert content.tobytes() == b"FROM centos\n"
+            assert reader.read("HEAD").startswith(b"tree ")
+            with pytest.raises(KeyError):
+                reader.read("HEAD", "missing")
+            with pytest.raises(ValueError):
+                reader.read("HEAD", "new\nline")
+            # still in sync after errors
+            assert reader.read("HEAD~1", "empty", as_memoryview=True).nbytes == 0
+
+    def test_restart(self, repo):
+        with CatFile(repo) as reader:
+            assert reader.read("HEAD", "Dockerfile") == b"FROM centos\n"
+            process = reader._process
+            process.kill()
+            process.wait()
+            assert reader.read("HEAD", "Dockerfile") == b"FROM centos\n"
+            assert reader._process is not process
+        assert reader._process is None
+
+    def test_cat_file(self, repo):
+        reader = cat_file(repo)
+        assert cat_file(join(repo, ".")) is reader
+        assert reader.read("HEAD", "Dockerfile") == b"FROM centos\n"
+        reader.close()
+
+    def test_cat_file_eviction(self, repo, tmpdir, monkeypatch):
+        monkeypatch.setattr(git, "MAX_READERS", 2)
+        git.close_readers()
+        worktrees = []
+        for name in "abc":
+            worktree = str(tmpdir.join(name))
+            run_cmd(["git", "-C", repo, "worktree", "add", "--quiet", worktree])
+            worktrees.append(worktree)
+        first = cat_file(worktrees[0])
+        assert first.read("HEAD", "empty") == b""
+        second = cat_file(worktrees[1])
+        assert second.read("HEAD", "empty") == b""
+        cat_file(worktrees[0])
+        # second is the least recently used one
+        cat_file(worktrees[2])
+        assert list(git._readers) == [worktrees[0], worktrees[2]]
+        assert second._process is None
+        assert first._process is not None
+        # readers of removed directories are closed
+        rmtree(worktrees[0])
+        cat_file(repo)
+        assert list(git._readers) == [worktrees[2], repo]
+        assert first._process is None
+        git.close_readers()
+
+
+class TestAsyncGit(object):
+    """Test AsyncGit class."""
+
+    @pytest.fixture()
+    def repos(self, tmpdir):
+        repos = []
+        for name in ("a", "b b", "c"):
+            repo = str(tmpdir.mkdir(name))
+            run_cmd(["git", "init", "--quiet", repo])
+            commit(repo, "README.md", name)
+            repos.append(repo)
+        return repos
+
+    def test_run_all(self, repos):
+        runner = AsyncGit(concurrency=2)
+        results = asyncio.run(runner.run_all(["ls-files"], repos))
+        assert [result.rc for result in results] == [0, 0, 0]
+        assert [result.stdout for result in results] == ["README.md\n"] * 3
+        assert all(result.duration > 0 for result in results)
+        # runner can be used by another event loop
+        result = asyncio.run(runner.run("rev-parse --show-toplevel", cwd=repos[1]))
+        assert result.stdout.strip() == repos[1]
+
+    def test_run_error(self, repos):
+        runner = AsyncGit()
+        result = asyncio.run(runner.run(["show", "nonsense"], git_dir=repos[0]))
+        assert result.rc != 0
+        assert "nonsense" in result.stderr
+        with pytest.raises(CalledProcessError):
+            asyncio.run(runner.run(["show", "nonsense"], git_dir=repos[0], check=True))
+        with pytest.raises(ValueError):
+            AsyncGit(concurrency=0)
+
+    def test_env(self):
+        env = {"GIT_AUTHOR_NAME": "Frambo Bot", "GIT_AUTHOR_EMAIL": "f@ram.bo"}
+        result = asyncio.run(AsyncGit().run(["var", "GIT_AUTHOR_IDENT"], env=env))
+        assert result.stdout.startswith("Frambo Bot <f@ram.bo>")
+
+    # git runs the command of an alias starting with "!" in shell
+    SLEEP = ["-c", "alias.sleep=!sleep 5", "sleep"]
+
+    def test_timeout(self):
+        result = asyncio.run(AsyncGit(timeout=0.2).run(self.SLEEP))
+        assert result.rc is None
+        assert result.duration < 4
+
+    def test_cancel(self):
+        runner = AsyncGit(concurrency=1)
+
+        async def cancel():
+            start = monotonic()
+            task = asyncio.ensure_future(runner.run(self.SLEEP))
+            waiting = asyncio.ensure_future(runner.run(["version"]))
+            await asyncio.sleep(0.2)
+            task.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await task
+            # the slot is released to the waiting command
+            assert (await waiting).stdout.startswith("git version")
+            return monotonic() - start
+
+        assert asyncio.run(cancel()) < 4
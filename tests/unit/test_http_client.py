@@ -0,0 +1,78 @@
+"""Test shared HTTP session."""
+
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from threading import Thread
+
+from flexmock import flexmock
+import pytest
+
+from frambo import http_client
+from frambo.http_client import create_session, get_session
+
+
+class FlakyHandler(BaseHTTPRequestHandler):
+    """Fails with 503 until `failures` is exhausted."""
+
+    protocol_version = "HTTP/1.1"
+    failures = 0
+    connections = set()
+
+    def do_GET(self):
+        FlakyHandler.connections.add(self.client_address)
+        if FlakyHandler.failures:
+            FlakyHandler.failures -= 1
+            status, body = 503, b"down"
+        else:
+            status, body = 200, b"ok"
+        self.send_response(status)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    FlakyHandler.failures = 0
+    FlakyHandler.connections = set()
+    httpd = HTTPServer(("127.0.0.1", 0), FlakyHandler)
+    thread = Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{httpd.server_port}/"
+    httpd.shutdown()
+    httpd.server_close()
+
+
+class TestHttpClient:
+    def test_retries(self, server):
+        session = create_session(retries=2, backoff_factor=0)
+        FlakyHandler.failures = 2
+        assert session.get(server).text == "ok"
+
+        # retries exhausted, last response is returned
+        FlakyHandler.failures = 3
+        assert session.get(server).status_code == 503
+
+    def test_keep_alive(self, server):
+        session = create_session()
+        for _ in range(5):
+            assert session.get(server).status_code == 200
+        assert len(FlakyHandler.connections) == 1
+
+    def test_adapters(self):
+        session = create_session(
+            connect_timeout=1, read_timeout=2, pool_maxsize=3, hosts={"pagure.io": 7}
+        )
+        default = session.get_adapter("https://example.com/")
+        assert default.timeout == (1, 2)
+        assert default._pool_maxsize == 3
+        assert session.get_adapter("https://pagure.io/foo")._pool_maxsize == 7
+
+    def test_get_session(self):
+        session = get_session()
+        assert get_session() is session
+        # forked process gets its own session
+        flexmock(http_client).should_receive("getpid").and_return(-1)
+        assert get_session() is not session
@@ -0,0 +1,296 @@
+# -*- coding: utf-8 -*-
+
+"""Test BackgroundHandler."""
+
+from calendar import timegm
+import gzip
+import logging
+import os
+from threading import Event
+import pytest
+
+from frambo.log_writer import (
+    BLOCK,
+    DROP_NEW,
+    DROP_OLD,
+    BackgroundHandler,
+    BatchFileHandler,
+    DailyFileHandler,
+    file_handler,
+    flush_writers,
+)
+from frambo.logger import Logger
+
+
+class ListHandler(logging.Handler):
+    """Collect messages, each one once gate is open."""
+
+    def __init__(self):
+        super().__init__()
+        self.messages = []
+        self.emitting = Event()
+        self.gate = Event()
+        self.gate.set()
+
+    def emit(self, record):
+        self.emitting.set()
+        self.gate.wait()
+        self.messages.append(record.getMessage())
+
+
+class FailingHandler(ListHandler):
+    """Fail to emit messages starting with 'fail'."""
+
+    def emit(self, record):
+        if record.getMessage().startswith("fail"):
+            raise OSError("disk is gone")
+        super().emit(record)
+
+
+def make_record(msg, level=logging.INFO, created=None):
+    record = logging.LogRecord("test", level, __file__, 0, msg, None, None)
+    if created:
+        record.created = timegm(created)
+    return record
+
+
+def read(path):
+    opener = gzip.open if path.endswith(".gz") else open
+    with opener(path, "rt") as log_file:
+        return log_file.read()
+
+
+class TestBackgroundHandler(object):
+    """Test BackgroundHandler class."""
+
+    def test_write(self, tmpdir):
+        path = str(tmpdir / "test.log")
+        handler = BackgroundHandler(BatchFileHandler(path), batch_size=3)
+        for i in range(10):
+            handler.handle(make_record(f"line {i}"))
+        handler.flush()
+        with open(path) as log_file:
+            assert log_file.read().splitlines() == [f"line {i}" for i in range(10)]
+        assert handler.stats["written"] == 10
+        handler.close()
+
+    def test_level(self):
+        target = ListHandler()
+        target.setLevel(logging.WARNING)
+        handler = BackgroundHandler(target)
+        handler.handle(make_record("info"))
+        handler.handle(make_record("warning", level=logging.WARNING))
+        handler.flush()
+        assert target.messages == ["warning"]
+        handler.close()
+
+    @pytest.mark.parametrize(
+        "overflow, expected",
+        [
+            (DROP_NEW, ["0", "1", "2", "3"]),
+            # "0" is already being written when the queue fills up
+            (DROP_OLD, ["0", "4", "5", "6"]),
+        ],
+    )
+    def test_overflow(self, overflow, expected):
+        target = ListHandler()
+        target.gate.clear()
+        handler = BackgroundHandler(target, queue_size=3, overflow=overflow)
+        handler.handle(make_record("0"))
+        # the writer thread is stuck writing "0"
+        assert target.emitting.wait(timeout=5)
+        for i in range(1, 7):
+            handler.handle(make_record(str(i)))
+        assert handler.stats["dropped"] == 3
+        target.gate.set()
+        handler.flush()
+        assert target.messages == expected
+        handler.close()
+
+    def test_failing_target(self, monkeypatch):
+        monkeypatch.setattr(logging, "raiseExceptions", False)
+        target = FailingHandler()
+        handler = BackgroundHandler(target, queue_size=1, overflow=BLOCK)
+        for msg in ("fail 1", "ok 1", "fail 2", "ok 2", "ok 3"):
+            handler.handle(make_record(msg))
+        handler.flush()
+        assert target.messages == ["ok 1", "ok 2", "ok 3"]
+        assert handler.stats["failed"] == 2
+        handler.close()
+
+    def test_restart(self):
+        target = ListHandler()
+        handler = BackgroundHandler(target)
+        handler.handle(make_record("before"))
+        handler.flush()
+        pid = handler._pid
+        # the thread is gone, as if killed by an error which escaped
+        handler.stop()
+        handler._pid = pid
+        assert not handler._thread.is_alive()
+        handler.handle(make_record("after"))
+        handler.flush()
+        assert target.messages == ["before", "after"]
+        handler.close()
+
+    def test_stop(self):
+        target = ListHandler()
+        handler = BackgroundHandler(target, overflow=BLOCK)
+        handler.handle(make_record("before"))
+        handler.stop()
+        assert target.messages == ["before"]
+        assert not handler._thread.is_alive()
+        # logging starts it again
+        handler.handle(make_record("after"))
+        handler.close()
+        assert target.messages == ["before", "after"]
+
+    @pytest.mark.parametrize(
+        "kwargs", [{"overflow": "explode"}, {"queue_size": 0}, {"batch_size": 0}]
+    )
+    def test_invalid(self, kwargs):
+        with pytest.raises(ValueError):
+            BackgroundHandler(ListHandler(), **kwargs)
+
+    def test_file_handler(self, tmpdir):
+        path = str(tmpdir / "task.log")
+        handler = file_handler(path)
+        assert isinstance(handler, BackgroundHandler)
+        assert file_handler(path) is handler
+        assert isinstance(file_handler(path, background=False), BatchFileHandler)
+
+    def test_logger(self, tmpdir):
+        path = str(tmpdir / "task.log")
+        loggers = [
+            Logger(
+                task_name="task.test.background",
+                level=logging.INFO,
+                file_path=path,
+                background=True,
+            )
+            for _ in range(3)
+        ]
+        log = loggers[-1]
+        handlers = [h for h in log.logger.handlers if isinstance(h, BackgroundHandler)]
+        assert len(handlers) == 1
+        report = {"message": "hello", "state": "before"}
+        log.log(logging.INFO, report)
+        report["state"] = "after"
+        flush_writers()
+        with open(path) as log_file:
+            content = log_file.read()
+        assert content.count('"message": "hello"') == 1
+        assert '"state": "before"' in content
+        log.logger.removeHandler(handlers[0])
+        handlers[0].close()
+
+
+class TestDailyFileHandler(object):
+    """Test DailyFileHandler class."""
+
+    def test_midnight(self, tmpdir):
+        base = str(tmpdir / "task.log")
+        handler = DailyFileHandler(base)
+        handler.date = "20261017"
+        handler.baseFilename = handler.dated_path(handler.date)
+        handler.emit_batch(
+            [
+                make_record("late", created=(2026, 10, 17, 23, 59, 59)),
+                make_record("early", created=(2026, 10, 18, 0, 0, 1)),
+            ]
+        )
+        handler.emit(make_record("later", created=(2026, 10, 18, 0, 0, 2)))
+        handler.housekeeping.join()
+        assert sorted(os.listdir(tmpdir)) == [
+            "task.log-20261017.gz",
+            "task.log-20261018",
+        ]
+        assert read(f"{base}-20261017.gz") == "late\n"
+        assert read(f"{base}-20261018") == "early\nlater\n"
+        handler.close()
+
+    def test_size(self, tmpdir):
+        base = str(tmpdir / "task.log")
+        handler = DailyFileHandler(base, max_bytes=10, backup_count=2)
+        for i in range(5):
+            handler.emit(make_record(f"line {i}"))
+            if handler.housekeeping:
+                handler.housekeeping.join()
+        today = handler.date
+        # line 0 and 1 were rotated to .1 and .2, which is gone
+        assert sorted(os.listdir(tmpdir)) == [
+            f"task.log-{today}",
+            f"task.log-{today}.3.gz",
+            f"task.log-{today}.4.gz",
+            "task.log.lock",
+        ]
+        assert read(f"{base}-{today}.3.gz") == "line 2\n"
+        assert read(f"{base}-{today}") == "line 4\n"
+        assert handler.rotated_files() == [
+            f"{base}-{today}.3.gz",
+            f"{base}-{today}.4.gz",
+        ]
+        handler.close()
+
+    def test_shared_file(self, tmpdir):
+        """Handlers of several processes write the same file."""
+        base = str(tmpdir / "task.log")
+        handlers = [DailyFileHandler(base, max_bytes=200, backup_count=0) for _ in "ab"]
+        for i in range(80):
+            handlers[i % 2].emit(make_record(f"line {i:02}"))
+        for handler in handlers:
+            if handler.housekeeping:
+                handler.housekeeping.join()
+        lines = "".join(read(str(file)) for file in tmpdir.listdir("task.log-*"))
+        assert sorted(lines.splitlines()) == [f"line {i:02}" for i in range(80)]
+        # all files (but the current one) got compressed & none is (much) bigger than max_bytes
+        assert len(tmpdir.listdir("task.log-*[0-9]")) == 1
+        assert max(os.path.getsize(file) for file in tmpdir.listdir("task.log-*")) < 220
+        for handler in handlers:
+            handler.close()
+
+    def test_shared_file_midnight(self, tmpdir):
+        """Another process writes yesterday's records after the file was compressed."""
+        base = str(tmpdir / "task.log")
+        handlers = [DailyFileHandler(base) for _ in "ab"]
+        for handler in handlers:
+            handler.date = "20261017"
+            handler.baseFilename = handler.dated_path(handler.date)
+        first, second = handlers
+        second.emit(make_record("late 1", created=(2026, 10, 17, 23, 59, 58)))
+        first.emit(make_record("late 2", created=(2026, 10, 17, 23, 59, 59)))
+        first.emit(make_record("early", created=(2026, 10, 18, 0, 0, 1)))
+        first.housekeeping.join()
+        second.emit(make_record("late 3", created=(2026, 10, 17, 23, 59, 59)))
+        first.emit(make_record("later", created=(2026, 10, 18, 0, 0, 2)))
+        first.housekeeping.join()
+        # today's file isn't compressed by a process which still writes yesterday's
+        second.clean_up()
+        assert os.path.exists(f"{base}-20261018")
+        second.emit(make_record("later 2", created=(2026, 10, 18, 0, 0, 3)))
+        second.housekeeping.join()
+        assert sorted(os.listdir(tmpdir)) == [
+            "task.log-20261017.gz",
+            "task.log-20261018",
+        ]
+        assert read(f"{base}-20261017.gz") == "late 1\nlate 2\nlate 3\n"
+        assert read(f"{base}-20261018") == "early\nlater\nlater 2\n"
+        for handler in handlers:
+            handler.close()
+
+    def test_logger(self, tmpdir, monkeypatch):
+        monkeypatch.setenv("LOGS_DIR", str(tmpdir))
+        log = Logger(
+            task_name="task.test.daily",
+            level=logging.INFO,
+            additional="foo",
+            background=False,
+        )
+        handler = log.logger.handlers[-1]
+        assert isinstance(handler, DailyFileHandler)
+        assert log.log_file == log.file_path(additional="foo")
+        assert log.log_file == f"{tmpdir}/task.test.daily-foo.log-{handler.date}"
+        log.log(logging.INFO, {"message": "hello"})
+        assert '"message": "hello"' in read(log.log_file)
+        log.logger.removeHandler(handler)
+        handler.close()
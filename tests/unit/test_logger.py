@@ -2,10 +2,13 @@
 
 """Test Logger class."""
 
+from flexmock import flexmock
+import json
 import logging
 import pytest
 
-from frambo.logger import Logger
+from frambo import logger as logger_module
+from frambo.logger import NDJSON, PRETTY, Logger, get_logger
 
 logger = logging.getLogger(__name__)
 
@@ -24,3 +27,71 @@ class TestLogger(object):
     )
     def test_format(self, msg, args, fmsg):
         assert Logger.format(msg, args) == fmsg
+
+    @pytest.fixture
+    def records(self):
+        records = []
+        handler = logging.Handler()
+        handler.emit = lambda record: records.append(record.getMessage())
+        log = Logger(task_name="task.test.lazy", level=logging.INFO, to_file=False)
+        log.logger.addHandler(handler)
+        yield log, records
+        log.logger.removeHandler(handler)
+
+    def test_log_lazy(self, records):
+        log, records = records
+        assert not log.is_enabled_for(logging.DEBUG)
+        flexmock(log).should_receive("dumps").never()
+        log.log(logging.DEBUG, {"message": "hidden"})
+        assert records == []
+
+    def test_log(self, records):
+        log, records = records
+        log.log(logging.INFO, {"message": "hello\nworld"})
+        assert len(records) == 1
+        assert "hello\nworld" in records[0]
+        assert '"level": "INFO"' in records[0]
+        assert '"task": "task.test.lazy"' in records[0]
+
+    @pytest.mark.parametrize("orjson", [logger_module.orjson, None])
+    def test_log_ndjson(self, records, orjson):
+        flexmock(logger_module, orjson=orjson)
+        log, records = records
+        log.log_format = NDJSON
+        log.log(
+            logging.INFO,
+            {
+                "message": "hello\nworld",
+                "path": logger_module,
+                "exit_codes": {0: "ok"},
+            },
+        )
+        assert len(records) == 1
+        assert "\n" not in records[0]
+        report = json.loads(records[0])
+        assert report["message"] == "hello\nworld"
+        assert report["level"] == "INFO"
+        assert report["path"] == str(logger_module)
+        assert report["exit_codes"] == {"0": "ok"}
+
+    @pytest.mark.parametrize(
+        "log_format, expected", [(None, PRETTY), (PRETTY, PRETTY), (NDJSON, NDJSON)]
+    )
+    def test_log_format(self, log_format, expected):
+        log = Logger(task_name="task.test.format", to_file=False, log_format=log_format)
+        assert log.log_format == expected
+
+    def test_log_format_unknown(self):
+        with pytest.raises(ValueError):
+            Logger(task_name="task.test.format", to_file=False, log_format="xml")
+
+    def test_get_logger(self):
+        log = get_logger(task_name=None, level=logging.INFO, to_file=False)
+        handlers = list(log.logger.handlers)
+        assert get_logger(task_name=None, level=logging.INFO, to_file=False) is log
+        assert get_logger(task_name=None, level=logging.DEBUG, to_file=False) is log
+        assert log.logger.level == logging.DEBUG
+        assert get_logger(task_name=None, to_file=False, log_format=NDJSON) is not log
+        # even separate Logger instances share the stderr handler
+        Logger(task_name=None, to_file=False)
+        assert log.logger.handlers == handlers
@@ -0,0 +1,74 @@
+"""Test metrics."""
+
+from urllib.request import urlopen
+
+import pytest
+
+from frambo import metrics
+from frambo.metrics import PHASE_DURATION, PHASE_ERRORS, Registry, serve, timed
+
+
+@pytest.fixture
+def registry(monkeypatch):
+    registry = Registry(buckets=(0.1, 1))
+    monkeypatch.setattr(metrics, "registry", registry)
+    return registry
+
+
+class TestMetrics:
+    def test_timed(self, registry):
+        with timed("clone", task="task.test"):
+            pass
+
+        @timed("fail")
+        def fail():
+            raise ValueError("oops")
+
+        for _ in range(2):
+            with pytest.raises(ValueError):
+                fail()
+
+        histogram = registry.get(PHASE_DURATION, phase="clone", task="task.test")
+        assert histogram.count == 1
+        assert histogram.counts == [1, 0, 0]
+        # outside of Celery task
+        assert registry.get(PHASE_DURATION, phase="fail", task="").count == 2
+        assert registry.get(PHASE_ERRORS, phase="fail", task="") == 2
+        assert registry.get(PHASE_ERRORS, phase="clone", task="task.test") is None
+
+    def test_render(self, registry):
+        registry.describe("frambo_test_seconds", "Test.")
+        for value in (0.05, 0.5, 5):
+            registry.observe("frambo_test_seconds", value, task='a "b"')
+        registry.inc("frambo_test_total", 3)
+        assert registry.render() == (
+            "# HELP frambo_test_seconds Test.\n"
+            "# TYPE frambo_test_seconds histogram\n"
+            'frambo_test_seconds_bucket{task="a \\"b\\"",le="0.1"} 1\n'
+            'frambo_test_seconds_bucket{task="a \\"b\\"",le="1"} 2\n'
+            'frambo_test_seconds_bucket{task="a \\"b\\"",le="+Inf"} 3\n'
+            'frambo_test_seconds_sum{task="a \\"b\\""} 5.55\n'
+            'frambo_test_seconds_count{task="a \\"b\\""} 3\n'
+            "# TYPE frambo_test_total counter\n"
+            "frambo_test_total 3\n"
+        )
+
+    def test_export(self, registry, tmp_path):
+        registry.inc("frambo_test_total")
+        path = tmp_path / "frambo.prom"
+        registry.write(path)
+        assert path.read_text() == registry.render()
+
+        server = serve(0)
+        try:
+            url = f"http://127.0.0.1:{server.server_port}/metrics"
+            with urlopen(url) as response:
+                assert response.read().decode() == registry.render()
+            # the port is taken, next one is used
+            other = serve(server.server_port, attempts=10)
+            assert other.server_port > server.server_port
+            other.shutdown()
+            other.server_close()
+        finally:
+            server.shutdown()
+            server.server_close()
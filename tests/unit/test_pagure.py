@@ -0,0 +1,63 @@
+"""Test Pagure API client."""
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Thread
+
+import pytest
+
+from frambo.config import settings
+from frambo.pagure import api_request, cfg_url
+
+
+class PagureHandler(BaseHTTPRequestHandler):
+    """Records requests, answers with JSON."""
+
+    protocol_version = "HTTP/1.1"
+    requests = []
+
+    def do_GET(self):
+        PagureHandler.requests.append((self.path, self.headers.get("Authorization")))
+        body = b'{"username": "bot"}'
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def pagure(monkeypatch):
+    PagureHandler.requests = []
+    # threading, the shared session keeps its connection open
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), PagureHandler)
+    thread = Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    monkeypatch.setattr(
+        settings, "PAGURE_URL", f"http://127.0.0.1:{httpd.server_port}/"
+    )
+    yield PagureHandler.requests
+    httpd.shutdown()
+    httpd.server_close()
+
+
+class TestPagure:
+    def test_api_request(self, pagure):
+        headers = {"Accept": "application/json"}
+        response = api_request("GET", "-/whoami", token="secret", headers=headers)
+        assert response.json() == {"username": "bot"}
+        # caller's headers are left alone
+        assert headers == {"Accept": "application/json"}
+
+        api_request("GET", "projects", params={"owner": "bot"})
+        assert pagure == [
+            ("/api/0/-/whoami", "token secret"),
+            ("/api/0/projects?owner=bot", None),
+        ]
+
+    def test_cfg_url(self, pagure):
+        assert cfg_url("foo", "master") == (
+            f"{settings.PAGURE_URL}foo/raw/master/f/bot-cfg.yml"
+        )
@@ -0,0 +1,98 @@
+"""Test pool of bot instances."""
+
+from celery import Celery
+from flexmock import flexmock
+import pytest
+
+from frambo import pool as pool_module
+from frambo.bot import Bot
+from frambo.pool import BotPool, get_pool, pooled
+
+
+class CountingBot(Bot):
+    created = 0
+
+    def __init__(self, task_name=None):
+        super().__init__(task_name=task_name)
+        CountingBot.created += 1
+        self.events = []
+        self.fail_reset = False
+
+    def checkout(self):
+        self.events.append("checkout")
+
+    def reset(self):
+        super().reset()
+        self.events.append("reset")
+        if self.fail_reset:
+            raise RuntimeError("can't clean up")
+
+    def process(self, msg):
+        self.config = msg
+        return msg
+
+
+@pytest.fixture(autouse=True)
+def created():
+    CountingBot.created = 0
+
+
+class TestBotPool:
+    def test_reuse(self):
+        pool = BotPool(CountingBot)
+        with pool.acquire() as bot:
+            bot.process("first")
+        with pool.acquire() as same_bot:
+            assert same_bot is bot
+            # per-task state is gone
+            assert bot.config is None
+        assert bot.events == ["checkout", "reset", "checkout", "reset"]
+        assert CountingBot.created == 1
+
+    def test_size(self):
+        pool = BotPool(CountingBot, size=2)
+        with pool.acquire(), pool.acquire(), pool.acquire():
+            assert CountingBot.created == 3
+        assert len(pool) == 2
+
+    def test_failed_reset(self):
+        pool = BotPool(CountingBot)
+        with pool.acquire() as bot:
+            bot.fail_reset = True
+        assert len(pool) == 0
+        with pool.acquire() as other:
+            assert other is not bot
+
+    def test_exception(self):
+        pool = BotPool(CountingBot)
+        with pytest.raises(ValueError):
+            with pool.acquire() as bot:
+                raise ValueError("task failed")
+        assert bot.events == ["checkout", "reset"]
+        assert len(pool) == 1
+
+    def test_fork(self):
+        pool = BotPool(CountingBot)
+        with pool.acquire() as bot:
+            pass
+        flexmock(pool_module).should_receive("getpid").and_return(-1)
+        with pool.acquire() as other:
+            assert other is not bot
+
+    def test_get_pool(self):
+        pool = get_pool(CountingBot, task_name="task.test.pool")
+        assert get_pool(CountingBot, task_name="task.test.pool") is pool
+        assert get_pool(CountingBot, task_name="task.test.other") is not pool
+
+    def test_pooled(self):
+        app = Celery()
+
+        @app.task(name="task.test.pooled")
+        @pooled(CountingBot, task_name="task.test.pooled")
+        def task(bot, msg):
+            assert bot.task_name == "task.test.pooled"
+            return bot.process(msg)
+
+        assert task("a") == "a"
+        assert task.apply(args=("b",)).get() == "b"
+        assert CountingBot.created == 1
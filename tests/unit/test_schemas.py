@@ -1,10 +1,12 @@
 from pathlib import Path
 
+from flexmock import flexmock
 import jsonschema
 import pytest
 from yaml import safe_load
 
-from frambo.schemas import BotCfg
+from frambo import schemas
+from frambo.schemas import BotCfg, get_validator, validate
 
 
 class TestSchemas:
@@ -28,3 +30,27 @@ class TestSchemas:
     def test_bad_bot_cfg(self, bad_cfg):
         with pytest.raises(jsonschema.exceptions.ValidationError):
             jsonschema.validate(bad_cfg, BotCfg.get_schema())
+
+    @pytest.mark.parametrize("compiled", [True, False])
+    def test_validate(self, example_bot_cfg, bad_cfg, compiled):
+        if compiled:
+            pytest.importorskip("fastjsonschema")
+            assert schemas.get_compiled_validator() is not None
+        else:
+            flexmock(schemas).should_receive("get_compiled_validator").and_return(None)
+        validate(example_bot_cfg)
+        with pytest.raises(jsonschema.exceptions.ValidationError) as exc:
+            validate(bad_cfg)
+        # detailed error, same as from jsonschema.validate()
+        with pytest.raises(jsonschema.exceptions.ValidationError) as expected:
+            jsonschema.validate(bad_cfg, BotCfg.get_schema())
+        assert exc.value.message == expected.value.message
+
+    def test_validate_formats(self, example_bot_cfg):
+        # jsonschema.validate() doesn't check formats and neither should validate()
+        example_bot_cfg["global"]["notifications"]["email_addresses"] = ["no email"]
+        jsonschema.validate(example_bot_cfg, BotCfg.get_schema())
+        validate(example_bot_cfg)
+
+    def test_validator_cached(self):
+        assert get_validator(BotCfg) is get_validator(BotCfg)
@@ -1,9 +1,12 @@
 """Test utilities from utils.py"""
 
+import copy
+import json
+import pickle
 import pytest
 from subprocess import CalledProcessError
 
-from frambo.utils import run_cmd
+from frambo.utils import FrozenDict, FrozenList, freeze, run_cmd, thaw
 
 
 class TestUtils(object):
@@ -22,3 +25,28 @@ class TestUtils(object):
                 run_cmd(cmd, ignore_error=False)
             assert run_cmd(cmd, ignore_error=True, return_output=True)
             assert run_cmd(cmd, ignore_error=True, return_output=False) > 0
+
+    def test_freeze(self):
+        data = {"a": {"b": [1, {"c": 2}]}, "d": "e"}
+        frozen = freeze(data)
+        assert frozen == data
+        assert isinstance(frozen["a"], FrozenDict)
+        assert isinstance(frozen["a"]["b"], FrozenList)
+        assert freeze(frozen) is frozen
+        assert json.loads(json.dumps(frozen)) == data
+        assert pickle.loads(pickle.dumps(frozen)) == data
+
+        for change in (
+            lambda: frozen.update(x=1),
+            lambda: frozen.pop("d"),
+            lambda: frozen["a"].__setitem__("x", 1),
+            lambda: frozen["a"]["b"].append(3),
+            lambda: frozen["a"]["b"][1].clear(),
+        ):
+            with pytest.raises(TypeError):
+                change()
+
+        writable = copy.deepcopy(frozen)
+        assert writable == thaw(frozen) == data
+        writable["a"]["b"][1]["c"] = 3
+        assert frozen["a"]["b"][1]["c"] == 2
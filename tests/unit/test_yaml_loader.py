@@ -0,0 +1,43 @@
+"""Test YAML loading."""
+
+import json
+from pathlib import Path
+
+import pytest
+import yaml
+
+from frambo import yaml_loader
+from frambo.yaml_loader import load_yaml, safe_load, set_yaml_parser
+
+DATA = Path(__file__).parent.parent / "data"
+
+
+@pytest.fixture(autouse=True)
+def default_parser():
+    set_yaml_parser(None)
+    yield
+    set_yaml_parser(None)
+
+
+class TestYamlLoader:
+    @pytest.mark.parametrize("path", sorted(DATA.glob("**/*.yml")))
+    @pytest.mark.parametrize("c_loader", [True, False])
+    def test_safe_load(self, path, c_loader, monkeypatch):
+        if not c_loader:
+            monkeypatch.delattr(yaml, "CSafeLoader", raising=False)
+        text = path.read_text()
+        assert safe_load(text) == yaml.safe_load(text)
+        with open(path) as stream:
+            assert load_yaml(stream) == yaml.safe_load(text)
+
+    def test_safe_load_is_safe(self):
+        with pytest.raises(yaml.YAMLError):
+            safe_load("!!python/object/apply:os.system ['true']")
+
+    def test_set_yaml_parser(self):
+        set_yaml_parser(json.loads)
+        assert load_yaml('{"a": [1]}') == {"a": [1]}
+
+    def test_parser_from_env(self, monkeypatch):
+        monkeypatch.setenv("FRAMBO_YAML_PARSER", "json:loads")
+        assert yaml_loader.get_yaml_parser() is json.loads